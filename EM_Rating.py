@@ -2,274 +2,245 @@
 import pathlib
 import pandas as pd
 import numpy as np
-import re
 from plotnine import *
 import scipy
 from tqdm import tqdm
 import time
 from sklearn.mixture import GaussianMixture
-
-
-locationUsersFile=pathlib.Path(r'D:/Game-Recommendation-System/data/raw_data/steam_users_purchase_play.csv')
-steam_clean = pd.read_csv(locationUsersFile, header=1, names=['user', 'game', 'hrs', 'purchase','play'])
-
-locationUsersFile_train=pathlib.Path(r'D:/Game-Recommendation-System/data/model_data/steam_user_train.csv')
-steam_traind = pd.read_csv(locationUsersFile_train, header=1, names=['user', 'game', 'hrs', 'purchase','play'])
-
-locationUsersFile_test=pathlib.Path(r'D:/Game-Recommendation-System/data/model_data/steam_user_test.csv')
-steam_test = pd.read_csv(locationUsersFile_test, header=1, names=['user', 'game', 'hrs', 'purchase','play'])
-
-game_freq = steam_traind.groupby(by='game').agg({'user': 'count', 'hrs': 'sum'}).reset_index()
-top20 = game_freq.sort_values(by='user',ascending=False)[:20].reset_index()
-#print(top20)
-steam_traind['user']=steam_traind['user'].astype(int)
-steam_clean['user']=steam_clean['user'].astype(int)
-steam_test['user']=steam_test['user'].astype(int)
-
-# Cleaning up the game columns. It doesn't like some of the special characters
-steam_traind['game1'] = steam_traind['game'].apply(lambda x: re.sub('[^a-zA-Z0-9]', '', x))
-steam_clean['game1'] = steam_clean['game'].apply(lambda x: re.sub('[^a-zA-Z0-9]', '', x))
-#steam_clean.head()
-
-#EM Algorithm based on raw data
-def game_hrs_density(GAME, nclass, print_vals=True):
-    #Ignore the game hrs less than 2 hrs
-    game_data = steam_clean[(steam_clean['game1'] == GAME)&(steam_clean['hrs']>2)]
-    #Log hrs
-    game_data['loghrs'] = np.log(steam_clean['hrs'])
-    #Calculate the mu,sigma to process Gaussian function
-    mu_init = np.linspace(min(game_data['loghrs']), max(game_data['loghrs']), nclass).reshape(-1, 1)
-    sigma_init = np.array([1] * nclass).reshape(-1, 1, 1)
-    gaussian = GaussianMixture(n_components=nclass, means_init=mu_init, precisions_init=sigma_init).fit(game_data['loghrs'].values.reshape([-1, 1]))
-    #print Gaussian Lambda Mean Sigma
-    if print_vals:
-        print(' lambda: {}\n mean: {}\n sigma: {}\n'.format(gaussian.weights_, gaussian.means_, gaussian.covariances_))
-    #Random Generate
-    x = np.linspace(min(game_data['loghrs']), max(game_data['loghrs']), 1000)
-    #Plot
-    dens = pd.DataFrame({'x': x})
-    for i in range(nclass):
-        dens['y{}'.format(i+1)] = gaussian.weights_[i]* scipy.stats.norm(gaussian.means_[i][0], gaussian.covariances_[i][0][0]).pdf(x)
-    dens = dens.melt('x', value_name='gaussian')
-    # Building data frame for plotting
-    game_plt = ggplot(aes(x='loghrs', y='stat(density)'), game_data) + geom_histogram(bins=25, colour = "black", alpha = 0.7, size = 0.1) + \
-               geom_area(dens, aes(x='x', y='gaussian', fill = 'variable'), alpha = 0.5, position = position_dodge(width=0.2)) + geom_density()+ \
-               ggtitle(GAME)
-    return game_plt
-#Print one example
-a = game_hrs_density('Fallout4', 5, True)
-print(a)
-
-
-# Create user item matrix
-np.random.seed(910)
-# Delete unnecessary characters
-game_freq['game1'] = game_freq['game'].apply(lambda x: re.sub('[^a-zA-Z0-9]', '', x))
-# Only Consider the games have more than 50 users
-game_users = game_freq[game_freq['user'] > 50]
-
-#For whole dataset
-steam_clean_pos = steam_clean[steam_clean['hrs'] > 2]
-steam_clean_pos_idx = steam_clean_pos['game1'].apply(lambda x: x in game_users['game1'].values)
-steam_clean_pos = steam_clean_pos[steam_clean_pos_idx]
-steam_clean_pos['loghrs'] = np.log(steam_clean_pos['hrs'])
-
-
-# make matrix
-games = pd.DataFrame({'game1': sorted(steam_clean_pos['game1'].unique()), 'game_id': range(len(steam_clean_pos['game1'].unique()))})
-users = pd.DataFrame({'user': sorted(steam_clean_pos['user'].unique()), 'user_id': range(len(steam_clean_pos['user'].unique()))})
-steam_clean_pos = pd.merge(steam_clean_pos, games, on=['game1'])
-steam_clean_pos = pd.merge(steam_clean_pos, users, on=['user'])
-
-ui_mat = np.zeros([len(users), len(games)])
-for i in range(steam_clean_pos.shape[0]):
-    line = steam_clean_pos.iloc[i]
-    ui_mat[line['user_id'], line['game_id']] = line['loghrs']
-
-#test dataset user
-users_test = pd.DataFrame({'user': sorted(steam_test['user'].unique()), 'user_id': range(len(steam_test['user'].unique()))})
-#print(users_test)
-
-# For train dataset
-# Only consider the games hrs more than 2 hrs
-steam_train = steam_traind[steam_traind['hrs'] > 2]
-#print(steam_train)
-#Not consider the games that users less than 50
-steam_train_idx = steam_train['game1'].apply(lambda x: x in game_users['game1'].values)
-steam_train = steam_train[steam_train_idx]
-steam_train['loghrs'] = np.log(steam_train['hrs'])
-# Make Matrix
-# List the games in train dataset use for recommend
-games_train = pd.DataFrame({'game1': sorted(steam_train['game1'].unique()), 'game_id': range(len(steam_train['game1'].unique()))})
-# List the users in train dataset use for recommend
-users_train = pd.DataFrame({'user': sorted(steam_train['user'].unique()), 'user_id': range(len(steam_train['user'].unique()))})
-#Merge the games and users to one data frame
-steam_train = pd.merge(steam_train, games_train, on=['game1'])
-steam_train = pd.merge(steam_train, users_train, on=['user'])
-
-# Create training set
-test=steam_train
-ui_train = ui_mat
-for i in range(test.shape[0]):
-    line = test.iloc[i]
-    ui_train[line['user_id'], line['game_id']] = 0
-print("Dimensions of training user-item matrix:", ui_train.shape)
-
-# Root Mean Squared error function, Evaluation metric for SVD
-def rmse(pred, test, data_frame=False):
-    test_pred = np.array([np.nan] * len(test))
-    for i in range(len(test)):
-        line = test.iloc[i]
-        test_pred[i] = pred[line['user_id'], line['game_id']]
-    if data_frame:
-        return pd.DataFrame({'test_pred': test_pred, 'loghrs': test['loghrs']})
-    return np.sqrt(1/(len(test)-1)*np.sum((test_pred - test['loghrs']) ** 2))
-
-# Basic svd
-Y = pd.DataFrame(ui_train).copy()
-
-# Impute the missing observations with a mean value
-means = np.mean(Y)
-for i, col in enumerate(Y.columns):
-    Y[col] = Y[col].apply(lambda x: means[i] if x == 0 else x)
-U, D, V = np.linalg.svd(Y)
-p_df = pd.DataFrame({'x': range(1, len(D)+1), 'y': D/np.sum(D)})
-
-#Set the latent factor as 60
-lc = 60
-pred = np.dot(np.dot(U[:, :lc], np.diag(D[:lc])), V[:lc, :])
-#Calculate rmse
-print(rmse(pred, test))
-rmse(pred, test, True).head()
-
-#SVD via gradient descent
-#Set the latent factor as 60
-leading_components=60
-
-# Setting matricies
-Y = pd.DataFrame(ui_train)
-I = Y.copy()
-
-for col in I.columns:
-    I[col] = I[col].apply(lambda x: 1 if x > 0 else 0)
-U = np.random.normal(0, 0.01, [I.shape[0], leading_components])
-V = np.random.normal(0, 0.01, [I.shape[1], leading_components])
-#Squared error
-def f(U, V):
-    return np.sum(I.values*(np.dot(U, V.T)-Y.values)**2)
-def dfu(U):
-    return np.dot((2*I.values*(np.dot(U, V.T)-Y.values)), V)
-def dfv(V):
-    return np.dot((2*I.values*(np.dot(U, V.T)-Y.values)).T, U)
-
-#Gradient descent
-N = 200
-alpha = 0.001
-pred = np.round(np.dot(U, V.T), decimals=2)
-fobj = [f(U, V)]
-rmsej = [rmse(pred, test)]
-start = time.time()
-#process iteratively until we get to the bottom
-for i in tqdm(range(N)):
-    U = U - alpha*dfu(U)
-    V = V - alpha*dfv(V)
-    fobj.append(f(U, V))
-    pred = np.round(np.dot(U, V.T), 2)
-    rmsej.append(rmse(pred, test))
-
-print('Time difference of {} mins'.format((time.time() - start) / 60))
-#fojb predicted values
-fojb = np.array(fobj)
-#rmsej actual observed values
-rmsej = np.array(rmsej)
-path1 = pd.DataFrame({'itr': range(1, N+2), 'fobj': fobj, 'fobjp': fobj/max(fobj), 'rmse': rmsej, 'rmsep': rmsej/max(rmsej)})
-path1gg = pd.melt(path1[["itr", "fobjp", "rmsep"]], id_vars=['itr'])
-print(path1.tail(1))
-
-print(ggplot(path1gg, aes('itr', 'value', color = 'variable')) + geom_line())
-
-# Create a rating based on time played after gradient descent
-def game_hrs_density_p(pred, GAME=None, nclass=1, print_vals=True):
-    game_dict = dict(games.values)
-    t_GAME = GAME
-    if not GAME:
-        GAME = np.random.randint(0, games.shape[0])
-    else:
-        GAME = game_dict[GAME]
-    game_data = pd.Series(pred[:, GAME])
-    game_data = game_data[game_data > 0]
-
-    # EM algorithm
-    mu_init = np.linspace(min(game_data), max(game_data), nclass).reshape(-1, 1)
-    sigma_init = np.array([1] * nclass).reshape(-1, 1, 1)
-    gaussian = GaussianMixture(n_components=nclass, means_init=mu_init, precisions_init=sigma_init).fit(game_data.values.reshape([-1, 1]))
-    if print_vals:
-        print(' lambda: {}\n mean: {}\n sigma: {}\n'.format(gaussian.weights_, gaussian.means_, gaussian.covariances_))
-    # building data frame for plotting
-    x = np.linspace(min(game_data), max(game_data), 1000)
-    dens = pd.DataFrame({'x': x})
-    for i in range(nclass):
-        dens['y{}'.format(i+1)] = gaussian.weights_[i]* scipy.stats.norm(gaussian.means_[i][0], gaussian.covariances_[i][0][0]).pdf(x)
-    dens = dens.melt('x', value_name='gaussian')
-    game_data = pd.DataFrame(game_data, columns=['game_daat'])
-    game_plt = ggplot(aes(x='game_data', y='stat(density)'), game_data) + geom_histogram(bins=45, colour = "black", alpha = 0.7, size = 0.1) + \
-               geom_area(dens, aes(x='x', y='gaussian', fill = 'variable'), alpha = 0.5, position = position_dodge(width=0.2)) + geom_density()+ \
-               ggtitle(t_GAME)
-    return game_plt
-
-a = game_hrs_density_p(pred, "Fallout4", 5)
-print(a)
-
-# Export recommend games
-user_dict = dict(users.values)
-game_dict = {games.iloc[i, 0]: games.iloc[i, 1] for i in range(games.shape[0])}
-I_pred = np.zeros_like(I)
-for i in range(steam_clean.shape[0]):
-    line = steam_clean.iloc[i]
-    if line['user'] in user_dict and line['game1'] in game_dict:
-        I_pred[user_dict[line['user']], game_dict[line['game1']]] = 1
-
-reverse_game_dict = {games.iloc[i, 1]: games.iloc[i, 0] for i in range(games.shape[0])}
-pred_percentile = pd.DataFrame(pred)
-for col in pred_percentile.columns:
-    pred_percentile[col] = pred_percentile[col].rank(pct=True)
-pred_percentile = pred_percentile.values
-
-def top(n, user, print_value=True):
-    #Not consider the games has been purchsed
-    not_purchased = (I - 1) % 2
-    t_user = user
-    user = user_dict[user]
-    top_games = (pred_percentile*not_purchased).iloc[user]
-    top_games = list(top_games.sort_values(ascending=False)[:20].index)
-    #For test
-    if print_value:
-        print('top {} recommended games for user {}: '.format(n, t_user))
-        for i in range(n):
-            print(i, ")", reverse_game_dict[top_games[i]])
-    else:
-        result = [t_user]
-        for i in range(n):
-            result.append(reverse_game_dict[top_games[i]])
-        return result
-#top(20, 5250)
-
-top_N = 20
-result = []
-users_merge=pd.merge(users_test,users_train,on='user',how='inner')
-for idx, user in tqdm(enumerate(users_merge['user'].values)):
-    result.append(top(top_N, user, False))
-
-users_not=users_test[~users_test['user'].isin(users_merge['user'])]
-for user in users_not['user']:
-    empty=[user]
-    for i in range(20):
-        empty.append(0)
-    result.append(empty)
-df = pd.DataFrame(result)
-columns = ['user_id'] + ['{}'.format(i+1) for i in range(top_N)]
-df.columns = columns
-df.to_csv('D:/Game-Recommendation-System/data/output_data/Collaborative_EM_output.csv', index=None)
-
-
-
+from collaborative_recommender_em import user_item_matrix, remove_entries, indicator, MaskedFactorization
+from collaborative_recommender_em import MeanImputedSVD
+from collaborative_recommender_em import fit_game_mixtures
+from collaborative_recommender_em import PercentileScorer, top_n_items, export_top_n
+from game_names import normalize_game_names
+from table_io import read_table
+import evaluation
+
+
+if __name__ == "__main__":
+    locationUsersFile=pathlib.Path(r'D:/Game-Recommendation-System/data/raw_data/steam_users_purchase_play.csv')
+    steam_clean = read_table(locationUsersFile, header=1, names=['user', 'game', 'hrs', 'purchase','play'])
+
+    locationUsersFile_train=pathlib.Path(r'D:/Game-Recommendation-System/data/model_data/steam_user_train.csv')
+    steam_traind = read_table(locationUsersFile_train, header=1, names=['user', 'game', 'hrs', 'purchase','play'])
+
+    locationUsersFile_test=pathlib.Path(r'D:/Game-Recommendation-System/data/model_data/steam_user_test.csv')
+    steam_test = read_table(locationUsersFile_test, header=1, names=['user', 'game', 'hrs', 'purchase','play'])
+
+    game_freq = steam_traind.groupby(by='game').agg({'user': 'count', 'hrs': 'sum'}).reset_index()
+    top20 = game_freq.sort_values(by='user',ascending=False)[:20].reset_index()
+    #print(top20)
+    steam_traind['user']=steam_traind['user'].astype(int)
+    steam_clean['user']=steam_clean['user'].astype(int)
+    steam_test['user']=steam_test['user'].astype(int)
+
+    # Cleaning up the game columns. It doesn't like some of the special characters
+    game_names_cache = pathlib.Path(r'D:/Game-Recommendation-System/data/intermediate_data/game_name_keys.json')
+    steam_traind['game1'] = normalize_game_names(steam_traind['game'], game_names_cache, lower=False)
+    steam_clean['game1'] = normalize_game_names(steam_clean['game'], game_names_cache, lower=False)
+    #steam_clean.head()
+
+    #Ignore the game hrs less than 2 hrs, log hrs are computed once and the rows grouped by game once
+    steam_clean_played = steam_clean[steam_clean['hrs'] > 2].copy()
+    steam_clean_played['loghrs'] = np.log(steam_clean_played['hrs'])
+    steam_clean_played_games = steam_clean_played.groupby('game1')
+
+    #EM Algorithm based on raw data
+    def game_hrs_density(GAME, nclass, print_vals=True, mixtures=None):
+        game_data = steam_clean_played_games.get_group(GAME)
+        #Reuse the parameters of the batch fit if the game has a mixture with nclass components
+        game_mixture = mixtures[mixtures['game1'] == GAME] if mixtures is not None else []
+        if len(game_mixture) == nclass:
+            weights, means, variances = game_mixture['weight'].values, game_mixture['mean'].values, game_mixture['variance'].values
+        else:
+            #Calculate the mu,sigma to process Gaussian function
+            mu_init = np.linspace(min(game_data['loghrs']), max(game_data['loghrs']), nclass).reshape(-1, 1)
+            sigma_init = np.array([1] * nclass).reshape(-1, 1, 1)
+            gaussian = GaussianMixture(n_components=nclass, means_init=mu_init, precisions_init=sigma_init).fit(game_data['loghrs'].values.reshape([-1, 1]))
+            weights, means, variances = gaussian.weights_, gaussian.means_[:, 0], gaussian.covariances_.reshape(nclass)
+        #print Gaussian Lambda Mean Sigma
+        if print_vals:
+            print(' lambda: {}\n mean: {}\n sigma: {}\n'.format(weights, means, variances))
+        #Random Generate
+        x = np.linspace(min(game_data['loghrs']), max(game_data['loghrs']), 1000)
+        #Plot
+        dens = pd.DataFrame({'x': x})
+        for i in range(nclass):
+            dens['y{}'.format(i+1)] = weights[i]* scipy.stats.norm(means[i], variances[i]).pdf(x)
+        dens = dens.melt('x', value_name='gaussian')
+        # Building data frame for plotting
+        game_plt = ggplot(aes(x='loghrs', y='stat(density)'), game_data) + geom_histogram(bins=25, colour = "black", alpha = 0.7, size = 0.1) + \
+                   geom_area(dens, aes(x='x', y='gaussian', fill = 'variable'), alpha = 0.5, position = position_dodge(width=0.2)) + geom_density()+ \
+                   ggtitle(GAME)
+        return game_plt
+
+
+    # Create user item matrix
+    np.random.seed(910)
+    # Delete unnecessary characters
+    game_freq['game1'] = normalize_game_names(game_freq['game'], game_names_cache, lower=False)
+    # Only Consider the games have more than 50 users
+    game_users = game_freq[game_freq['user'] > 50]
+
+    #For whole dataset
+    steam_clean_pos = steam_clean_played[steam_clean_played['game1'].isin(game_users['game1'].values)].copy()
+
+    # Fit the hrs distribution of every game at once (EM algorithm, in parallel) and keep the
+    # mixture parameters, reused by the density plots
+    game_mixtures = fit_game_mixtures(steam_clean_pos, 'game1', 'loghrs', 5)
+    game_mixtures.to_csv('D:/Game-Recommendation-System/data/intermediate_data/game_hrs_mixtures.csv', index=None)
+    #Print one example
+    a = game_hrs_density('Fallout4', 5, True, game_mixtures)
+    print(a)
+
+
+    # make matrix
+    games = pd.DataFrame({'game1': sorted(steam_clean_pos['game1'].unique()), 'game_id': range(len(steam_clean_pos['game1'].unique()))})
+    users = pd.DataFrame({'user': sorted(steam_clean_pos['user'].unique()), 'user_id': range(len(steam_clean_pos['user'].unique()))})
+    steam_clean_pos = pd.merge(steam_clean_pos, games, on=['game1'])
+    steam_clean_pos = pd.merge(steam_clean_pos, users, on=['user'])
+
+    # Sparse user item matrix, only the observed log hrs are stored
+    ui_mat = user_item_matrix(steam_clean_pos, 'loghrs', (len(users), len(games)))
+
+    #test dataset user
+    users_test = pd.DataFrame({'user': sorted(steam_test['user'].unique()), 'user_id': range(len(steam_test['user'].unique()))})
+    #print(users_test)
+
+    # For train dataset
+    # Only consider the games hrs more than 2 hrs
+    steam_train = steam_traind[steam_traind['hrs'] > 2]
+    #print(steam_train)
+    #Not consider the games that users less than 50
+    steam_train_idx = steam_train['game1'].apply(lambda x: x in game_users['game1'].values)
+    steam_train = steam_train[steam_train_idx]
+    steam_train['loghrs'] = np.log(steam_train['hrs'])
+    # Make Matrix
+    # List the games in train dataset use for recommend
+    games_train = pd.DataFrame({'game1': sorted(steam_train['game1'].unique()), 'game_id': range(len(steam_train['game1'].unique()))})
+    # List the users in train dataset use for recommend
+    users_train = pd.DataFrame({'user': sorted(steam_train['user'].unique()), 'user_id': range(len(steam_train['user'].unique()))})
+    #Merge the games and users to one data frame
+    steam_train = pd.merge(steam_train, games_train, on=['game1'])
+    steam_train = pd.merge(steam_train, users_train, on=['user'])
+
+    # Create training set
+    test=steam_train
+    ui_train = remove_entries(ui_mat, test['user_id'].values, test['game_id'].values)
+    print("Dimensions of training user-item matrix:", ui_train.shape)
+
+    # Root Mean Squared error function, Evaluation metric for SVD
+    def rmse(model, test, data_frame=False):
+        test_pred = model.predict(test['user_id'].values, test['game_id'].values)
+        if data_frame:
+            return pd.DataFrame({'test_pred': test_pred, 'loghrs': test['loghrs']})
+        return evaluation.rmse(test_pred, test['loghrs'].values)
+
+    # Basic svd
+    # Missing observations are imputed with the mean value of their game, implicitly
+    # (the dense imputed matrix is never built), and only the leading components are computed
+    #Set the latent factor as 60
+    lc = 60
+    svd = MeanImputedSVD(n_factors=lc).fit(ui_train)
+    D = svd.singular_values
+    # Share of each component among the leading ones
+    p_df = pd.DataFrame({'x': range(1, len(D)+1), 'y': D/np.sum(D)})
+    #Calculate rmse
+    print(rmse(svd, test))
+    rmse(svd, test, True).head()
+
+    #SVD via gradient descent
+    #Set the latent factor as 60
+    leading_components=60
+
+    # Setting matricies
+    # Sparse indicator of the observed games, used to leave out the purchased games when exporting
+    I = indicator(ui_train)
+
+    #Gradient descent, loss and gradients are evaluated on the observed entries only
+    N = 200
+    alpha = 0.001
+    factorization = MaskedFactorization(n_factors=leading_components, method='gd', learning_rate=alpha,
+                                        n_iterations=N, seed=910)
+    start = time.time()
+    #process iteratively until we get to the bottom
+    factorization.fit(ui_train, test['user_id'].values, test['game_id'].values, test['loghrs'].values, progress=tqdm)
+    U, V = factorization.user_factors, factorization.item_factors
+
+    print('Time difference of {} mins'.format((time.time() - start) / 60))
+    #fobj squared error on the observed values
+    fobj = np.array(factorization.loss_)
+    #rmsej error on the test values
+    rmsej = np.array(factorization.rmse_)
+    path1 = pd.DataFrame({'itr': range(1, N+2), 'fobj': fobj, 'fobjp': fobj/max(fobj), 'rmse': rmsej, 'rmsep': rmsej/max(rmsej)})
+    path1gg = pd.melt(path1[["itr", "fobjp", "rmsep"]], id_vars=['itr'])
+    print(path1.tail(1))
+
+    print(ggplot(path1gg, aes('itr', 'value', color = 'variable')) + geom_line())
+
+    # Create a rating based on time played after gradient descent
+    def game_hrs_density_p(factorization, GAME=None, nclass=1, print_vals=True):
+        game_dict = dict(games.values)
+        t_GAME = GAME
+        if not GAME:
+            GAME = np.random.randint(0, games.shape[0])
+        else:
+            GAME = game_dict[GAME]
+        n_users = factorization.user_factors.shape[0]
+        game_data = pd.Series(factorization.predict(np.arange(n_users), np.full(n_users, GAME)).round(2))
+        game_data = game_data[game_data > 0]
+
+        # EM algorithm
+        mu_init = np.linspace(min(game_data), max(game_data), nclass).reshape(-1, 1)
+        sigma_init = np.array([1] * nclass).reshape(-1, 1, 1)
+        gaussian = GaussianMixture(n_components=nclass, means_init=mu_init, precisions_init=sigma_init).fit(game_data.values.reshape([-1, 1]))
+        if print_vals:
+            print(' lambda: {}\n mean: {}\n sigma: {}\n'.format(gaussian.weights_, gaussian.means_, gaussian.covariances_))
+        # building data frame for plotting
+        x = np.linspace(min(game_data), max(game_data), 1000)
+        dens = pd.DataFrame({'x': x})
+        for i in range(nclass):
+            dens['y{}'.format(i+1)] = gaussian.weights_[i]* scipy.stats.norm(gaussian.means_[i][0], gaussian.covariances_[i][0][0]).pdf(x)
+        dens = dens.melt('x', value_name='gaussian')
+        game_data = pd.DataFrame(game_data, columns=['game_daat'])
+        game_plt = ggplot(aes(x='game_data', y='stat(density)'), game_data) + geom_histogram(bins=45, colour = "black", alpha = 0.7, size = 0.1) + \
+                   geom_area(dens, aes(x='x', y='gaussian', fill = 'variable'), alpha = 0.5, position = position_dodge(width=0.2)) + geom_density()+ \
+                   ggtitle(t_GAME)
+        return game_plt
+
+    a = game_hrs_density_p(factorization, "Fallout4", 5)
+    print(a)
+
+    # Export recommend games
+    user_dict = dict(users.values)
+    reverse_game_dict = {games.iloc[i, 1]: games.iloc[i, 0] for i in range(games.shape[0])}
+    # Percentile of the predicted hrs of each user within each game, computed by blocks of users.
+    # Approximated against 1024 quantiles of each game's predictions to bound the memory: the top 20
+    # differs from the exact ranking (n_quantiles=None), e.g. with 12000 users and 400 games about
+    # 0.3% of the recommended games and 11% of their positions changed
+    scorer = PercentileScorer(U, V, decimals=2, n_quantiles=1024)
+
+    def top(n, user, print_value=True):
+        #Not consider the games has been purchsed
+        t_user = user
+        user = user_dict[user]
+        top_games = top_n_items(scorer, I, [user], 20)[0]
+        #For test
+        if print_value:
+            print('top {} recommended games for user {}: '.format(n, t_user))
+            for i in range(n):
+                print(i, ")", reverse_game_dict[top_games[i]])
+        else:
+            result = [t_user]
+            for i in range(n):
+                result.append(reverse_game_dict[top_games[i]])
+            return result
+    #top(20, 5250)
+
+    top_N = 20
+    users_merge=pd.merge(users_test,users_train,on='user',how='inner')
+    users_not=users_test[~users_test['user'].isin(users_merge['user'])]
+    # Users of both datasets first, then the test users without recommendation (0)
+    export_users = np.concatenate([users_merge['user'].values, users_not['user'].values])
+    export_rows = np.concatenate([users_merge['user'].map(user_dict).fillna(-1).astype(int).values, np.full(len(users_not), -1)])
+    export_top_n('D:/Game-Recommendation-System/data/output_data/Collaborative_EM_output.csv', scorer, I,
+                 export_rows, export_users, games['game1'].values, top_N)
@@ -1,105 +1,178 @@
 # Import modules
+import json
+import os
 import pandas as pd
 
-games_df = pd.read_csv('Games_dataset.csv', index_col=0)
-
-print('Number of games loaded: %s ' % (len(games_df)), '\n')
-
-# Display the data
-games_df.head()
-
-
-import nltk
-nltk.download('punkt')
-import re
-from nltk.stem.snowball import SnowballStemmer
-#nltk.download('punkt')
-
-# Create an English language SnowballStemmer object
-stemmer = SnowballStemmer("english")
-
-# Define a function to perform both stemming and tokenization
-def tokenize_and_stem(text):
-    
-    # Tokenize by sentence, then by word - thực hiện tokenization (spliting token)
-    tokens = [word for sent in nltk.sent_tokenize(text) 
-              for word in nltk.word_tokenize(sent)]
-    
-    # Filter out raw tokens to remove noise - Chuẩn hóa các token (token normalization)
-    filtered_tokens = [token for token in tokens if re.search('[a-zA-Z]', token)]
-    
-    # Stem the filtered_tokens
-    stems = [stemmer.stem(word) for word in filtered_tokens]
-    
-    return stems
-
-# kỹ thuật extract features từ input text
-# create input features to train NLP models
-# Transform token into features
-from sklearn.feature_extraction.text import TfidfVectorizer
-
-# Instantiate TfidfVectorizer object with stopwords and tokenizer
-tfidf_vectorizer = TfidfVectorizer(max_df=0.8, max_features=200000,
-                                 min_df=0.2, stop_words='english',
-                                 use_idf=True, tokenizer=tokenize_and_stem,
-                                 ngram_range=(1,3))
-
-# Fit and transform the tfidf_vectorizer
-tfidf_matrix = tfidf_vectorizer.fit_transform([x for x in games_df["Plots"]])
-# ==================================KMeans==================================================================
-from sklearn.cluster import KMeans
-
-km = KMeans(n_clusters=7)
-
-# Fit the k-means object with tfidf_matrix
-km.fit(tfidf_matrix)
-
-clusters = km.labels_.tolist()
-
-games_df["cluster"] = clusters
-games_df['cluster'].value_counts() 
-
-# =================================Hierarchy===================================================================
-
-# Import matplotlib.pyplot for plotting graphs
-from sklearn.metrics.pairwise import cosine_similarity
-from scipy.cluster.hierarchy import linkage, dendrogram
-import matplotlib.pyplot as plt
-
-# Calculate the similarity distance
-similarity_distance = 1 - cosine_similarity(tfidf_matrix)
-
-# Create mergings matrix 
-mergings = linkage(similarity_distance, method='complete')
-
-# ===================================================================Plot the dendrogram, using title as label column
-dendrogram_ = dendrogram(mergings,
-               labels=[x for x in games_df["Title"]],
-               leaf_rotation=90,
-               leaf_font_size=16,
-)
-
-# Adjust the plot
-fig = plt.gcf()
-_ = [lbl.set_color('r') for lbl in plt.gca().get_xmajorticklabels()]
-fig.set_size_inches(108, 21)
-
-plt.savefig('dendo.png', dpi=100)
-plt.show()
-
-# ===================================================================Create a dataframe from the similarity matrix to export
-vals = games_df.Title.tolist()
-similarity_df = pd.DataFrame(similarity_distance, columns=vals, index=vals)
-# Export
-similarity_df.to_csv('sim_matrix.csv')
-
-
-# ===================================================================Recommendation example
-title = 'New Super Mario Bros. U Deluxe'
-
-matches = similarity_df[title].sort_values()[1:6]
-matches = matches.index.tolist()
-games_df.set_index('Title').loc[matches]
+from table_io import read_table, write_table
+
+
+if __name__ == "__main__":
+    games_df = read_table('Games_dataset.csv', index_col=0)
+
+    print('Number of games loaded: %s ' % (len(games_df)), '\n')
+
+    # Display the data
+    games_df.head()
+
+
+    # Tokenization and stemming - thực hiện tokenization (spliting token) và chuẩn hóa các token (token normalization).
+    # Plots are tokenized in a process pool with memoized stems, and the token streams are saved in
+    # 'sim_tokens.json' so that refits and parameter sweeps only tokenize new or changed plots.
+    # Nothing is downloaded: sentences are split with nltk punkt when it is installed, with regular
+    # expressions otherwise (PLOT_TOKENIZER = 'auto', 'nltk' or 'regex').
+    from plot_tokenizer import tokenize_cached, identity, TOKENIZER_NAME
+
+    # kỹ thuật extract features từ input text
+    # create input features to train NLP models
+    # Transform token into features
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from incremental_tfidf import IncrementalTfidf, content_hash
+
+    # Build mode: 'incremental' keeps the vocabulary/IDF and the vectors saved in 'sim_model' and only
+    # vectorizes the new or changed plots; 'full' refits everything. A full build is also done when
+    # nothing was saved yet, or when more than 'refit_fraction' of the games changed (IDF drift).
+    similarity_mode = os.environ.get('SIMILARITY_MODE', 'incremental')
+    refit_fraction = float(os.environ.get('SIMILARITY_REFIT_FRACTION', 0.2))
+    # Neighbor search of the full builds: 'exact' (all pairs) or 'ann' (approximate, SVD embedding and IVF
+    # index, see ann_index.py; SIMILARITY_NPROBE lists probed, more is slower with a better recall).
+    similarity_search = os.environ.get('SIMILARITY_SEARCH', 'exact')
+    similarity_nprobe = int(os.environ.get('SIMILARITY_NPROBE', 8))
+    # Clustering of the plots: 'full' (KMeans, then complete linkage of all pairs and its dendrogram in full
+    # builds) or 'scalable' (MiniBatchKMeans, then agglomeration along the top-K neighbor graph, no N x N
+    # matrix at all; see plot_clustering.py). Incremental builds use the neighbor graph agglomeration too, and
+    # leave the dense store 'sim_store' of the last full build, whose stamp then marks it stale. The labels are
+    # saved with the games in 'games_clusters.csv'.
+    similarity_clustering = os.environ.get('SIMILARITY_CLUSTERING', 'full')
+    n_clusters = 7
+
+    # Instantiate TfidfVectorizer object with stopwords, fed with the (lower cased) token streams
+    tfidf_vectorizer = TfidfVectorizer(max_df=0.8, max_features=200000,
+                                     min_df=0.2, stop_words='english',
+                                     use_idf=True, tokenizer=identity,
+                                     preprocessor=identity, lowercase=False,
+                                     token_pattern=None, ngram_range=(1,3))
+
+    titles = games_df["Title"].tolist()
+    # Titles may repeat (e.g. two games named Doom): the wiki links identify the games
+    keys = games_df["Link"].tolist()
+    plots = [x for x in games_df["Plots"]]
+    plot_tokens = tokenize_cached(plots, 'sim_tokens.json')
+
+    plot_model = None
+    if similarity_mode == 'incremental' and IncrementalTfidf.exists('sim_model') and os.path.exists('sim_index'):
+        plot_model = IncrementalTfidf.load('sim_model', tfidf_vectorizer.build_analyzer())
+        try:
+            changed, removed = plot_model.changes(keys, plots)
+        except ValueError as error:
+            print(error, 'Full build.')
+            plot_model = None
+        else:
+            # The vocabulary and IDF were fitted on the token streams of one tokenizer
+            if plot_model.tokenizer != TOKENIZER_NAME:
+                print('Tokenizer changed ({} -> {}). Full build.'.format(plot_model.tokenizer, TOKENIZER_NAME))
+                plot_model = None
+            elif len(changed) + len(removed) > refit_fraction * len(titles):
+                plot_model = None
+    incremental = plot_model is not None
+
+    if incremental:
+        # Vectorize only the new or changed plots
+        changed = plot_model.update(keys, plots, plot_tokens)
+        tfidf_matrix = plot_model.vectors
+        print('Games vectorized: {} new or changed, {} removed'.format(len(changed), len(removed)))
+    else:
+        # Fit and transform the tfidf_vectorizer
+        tfidf_matrix = tfidf_vectorizer.fit_transform(plot_tokens)
+        plot_model = IncrementalTfidf.from_fitted(tfidf_vectorizer, tfidf_matrix, keys, plots, TOKENIZER_NAME)
+    plot_model.save('sim_model')
+    # Stamp of the catalogue (games, plots and tokenizer), saved with the dense similarity store
+    catalogue_stamp = content_hash(json.dumps([plot_model.tokenizer, plot_model.keys, plot_model.hashes]))
+    # ==================================KMeans==================================================================
+    from sklearn.cluster import KMeans
+    from plot_clustering import minibatch_clusters
+
+    if similarity_clustering == 'scalable':
+        clusters = minibatch_clusters(tfidf_matrix, n_clusters).tolist()
+    else:
+        km = KMeans(n_clusters=n_clusters)
+
+        # Fit the k-means object with tfidf_matrix
+        km.fit(tfidf_matrix)
+
+        clusters = km.labels_.tolist()
+
+    games_df["cluster"] = clusters
+    games_df['cluster'].value_counts() 
+
+    # =================================Hierarchy===================================================================
+    from similarity_index import SimilarityStore, NeighborIndex
+
+    if not incremental and similarity_clustering == 'full':
+        # Import matplotlib.pyplot for plotting graphs
+        from sklearn.metrics.pairwise import cosine_similarity
+        from scipy.cluster.hierarchy import dendrogram, fcluster
+        from plot_clustering import full_linkage
+        import matplotlib.pyplot as plt
+
+        # Calculate the similarity distance
+        similarity_distance = 1 - cosine_similarity(tfidf_matrix)
+
+        # Create mergings matrix (from the condensed distances)
+        mergings = full_linkage(1 - similarity_distance, method='complete')
+        games_df["hierarchy_cluster"] = fcluster(mergings, n_clusters, criterion='maxclust') - 1
+
+        # ===================================================================Plot the dendrogram, using title as label column
+        dendrogram_ = dendrogram(mergings,
+                       labels=[x for x in games_df["Title"]],
+                       leaf_rotation=90,
+                       leaf_font_size=16,
+        )
+
+        # Adjust the plot
+        fig = plt.gcf()
+        _ = [lbl.set_color('r') for lbl in plt.gca().get_xmajorticklabels()]
+        fig.set_size_inches(108, 21)
+
+        plt.savefig('dendo.png', dpi=100)
+        plt.show()
+
+        # ===================================================================Export the similarity matrix as a memory-mapped binary store
+        vals = games_df.Title.tolist()
+        similarity_store = SimilarityStore.save('sim_store', 1 - similarity_distance, vals, stamp=catalogue_stamp)
+
+    # ===================================================================Export the top-K neighbor index used by the apps
+    if incremental:
+        # The quadratic steps (all pairs similarity, dendrogram, dense store) only run in full builds,
+        # only the rows of the neighbor index affected by the changed games are searched
+        neighbor_index = NeighborIndex.load('sim_index').updated(tfidf_matrix, titles, changed, keys=keys)
+    elif similarity_search == 'ann':
+        from ann_index import ann_top_k
+        neighbor_index = NeighborIndex(*ann_top_k(tfidf_matrix, 20, nprobe=similarity_nprobe), titles, keys)
+    elif similarity_clustering == 'full':
+        neighbor_index = similarity_store.neighbor_index(k=20, keys=keys)
+    else:
+        neighbor_index = NeighborIndex.from_vectors(tfidf_matrix, titles, k=20, keys=keys)
+    neighbor_index.save('sim_index')
+
+    if "hierarchy_cluster" not in games_df:
+        # Scalable and incremental builds: hierarchical clustering restricted to the edges of the neighbor graph
+        from plot_clustering import neighbor_graph_clusters
+        games_df["hierarchy_cluster"] = neighbor_graph_clusters(tfidf_matrix, neighbor_index.ids, n_clusters)
+
+        # The dense similarity store of an earlier full build is kept, its stamp tells whether it matches the games
+        if os.path.exists('sim_store') and SimilarityStore.stamp('sim_store') != catalogue_stamp:
+            print("'sim_store' is stale (built for another catalogue), a full build "
+                  "(SIMILARITY_MODE=full, SIMILARITY_CLUSTERING=full) refreshes it.")
+
+    # ===================================================================Export the cluster labels with the games
+    write_table(games_df[["Title", "cluster", "hierarchy_cluster"]], 'games_clusters.csv')
+
+
+    # ===================================================================Recommendation example
+    title = 'New Super Mario Bros. U Deluxe'
+
+    matches = neighbor_index.neighbors(title, 5)
+    games_df.set_index('Title').loc[matches]
 
 
 
@@ -1,6 +1,7 @@
-from pandas import read_csv
+from pandas import read_csv, to_numeric
 import re
 import pathlib
+from table_io import write_table
 
 # Get data from CSV
 locationGamesFile = pathlib.Path(r'../../data/raw_data/steam_games.csv')
@@ -29,7 +30,9 @@ for i, row in dataGames.iterrows():
 possibleReview = dataGames["review_qualification"].unique()
 print(possibleReview)
 
+# percentages were written as text, keep a numeric column (as read back from csv)
+dataGames["percentage_positive_review"] = to_numeric(dataGames["percentage_positive_review"], errors='coerce')
+
 # print csv of reviews
-dataGames.to_csv(pathlib.Path(r'../../data/intermediate_data/steam_games_reviews.csv'),
-                 columns=["name", "percentage_positive_review", "review_qualification", "all_reviews"],
-                 index=False)
+write_table(dataGames, pathlib.Path(r'../../data/intermediate_data/steam_games_reviews.csv'),
+            columns=["name", "percentage_positive_review", "review_qualification", "all_reviews"])
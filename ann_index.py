@@ -0,0 +1,276 @@
+import json
+import sys
+import time
+import numpy as np
+import pandas as pd
+import scipy.sparse as sparse
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.preprocessing import normalize
+from similarity_index import top_k_cosine
+
+
+def embed(vectors, n_components=128, seed=0):
+    """
+    Function to reduce (sparse) feature vectors, L2 normalized, to a dense
+    embedding with a truncated SVD. Vectors with fewer features than
+    'n_components' are only densified. The embedding rows are L2 normalized
+    (float32), so their dot product approximates the cosine similarity.
+    """
+
+    vectors = normalize(vectors, norm='l2', axis=1)
+
+    if vectors.shape[1] <= n_components:
+        embedding = vectors.toarray() if sparse.issparse(vectors) else np.asarray(vectors)
+    else:
+        embedding = TruncatedSVD(n_components, random_state=seed).fit_transform(vectors)
+
+    return normalize(embedding, norm='l2', axis=1).astype(np.float32)
+
+
+def _top_k_merge(ids, scores, new_ids, new_scores, k):
+    """
+    Function to merge two candidate lists per row and keep the 'k' best,
+    best first (ties by id).
+    """
+
+    ids = np.hstack([ids, new_ids])
+    scores = np.hstack([scores, new_scores])
+
+    if ids.shape[1] > k:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        ids, scores = np.take_along_axis(ids, top, axis=1), np.take_along_axis(scores, top, axis=1)
+    order = np.lexsort((ids, -scores), axis=1)
+
+    return np.take_along_axis(ids, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+class IVFIndex:
+    """
+    Class for an inverted file (IVF) approximate nearest neighbor index over
+    L2 normalized embeddings, with the dot product (cosine) as similarity.
+    The embeddings are split in 'n_lists' lists by a spherical k-means, and a
+    query is only compared with the embeddings of the 'nprobe' lists whose
+    centroids are the closest: more lists probed give a better recall and a
+    slower search.
+    """
+
+    def __init__(self, n_lists=None, nprobe=8, n_iter=10, seed=0):
+        """
+        Class initialization with the index parameters ('n_lists' defaults to
+        the square root of the number of embeddings).
+        """
+
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.n_iter = n_iter
+        self.seed = seed
+
+        self.embedding, self.centroids, self.lists = None, None, None
+
+    def __assign(self, embedding, chunk_size=4096):
+        labels = np.empty(len(embedding), dtype=np.int64)
+        for start in range(0, len(embedding), chunk_size):
+            labels[start:start + chunk_size] = np.argmax(embedding[start:start + chunk_size] @ self.centroids.T, axis=1)
+        return labels
+
+    def fit(self, embedding):
+        """
+        Method to build the lists from the embeddings [n, d].
+        """
+
+        rng = np.random.default_rng(self.seed)
+        embedding = np.asarray(embedding, dtype=np.float32)
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(embedding))))
+        n_lists = min(n_lists, len(embedding))
+
+        # Spherical k-means: centroids are the normalized mean of their embeddings.
+        self.centroids = embedding[rng.choice(len(embedding), n_lists, replace=False)]
+        for _ in range(self.n_iter):
+            labels = self.__assign(embedding)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, labels, embedding)
+            empty = ~np.bincount(labels, minlength=n_lists).astype(bool)
+            sums[empty] = embedding[rng.choice(len(embedding), empty.sum())]
+            self.centroids = normalize(sums, norm='l2', axis=1).astype(np.float32)
+
+        labels = self.__assign(embedding)
+        order = np.argsort(labels, kind='stable')
+        offsets = np.searchsorted(labels[order], np.arange(n_lists + 1))
+
+        self.embedding = embedding
+        self.lists = [order[offsets[i]:offsets[i + 1]] for i in range(n_lists)]
+
+        return self
+
+    def search(self, queries, k=20, nprobe=None, exclude=None):
+        """
+        Method to find the 'k' closest embeddings of each query [m, d].
+        'exclude' optionally gives, for each query, an id to leave out (e.g.
+        the query itself). Returns two arrays [m, k]: ids (int32, -1 when
+        fewer candidates were found) and scores (float32), closest first.
+        """
+
+        queries = np.asarray(queries, dtype=np.float32)
+        nprobe = min(nprobe or self.nprobe, len(self.lists))
+        n_queries = len(queries)
+
+        ids = np.full((n_queries, k), -1, dtype=np.int64)
+        scores = np.full((n_queries, k), -np.inf, dtype=np.float32)
+
+        # Lists probed by each query, then each list is searched for all its queries at once.
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        query_order = np.argsort(probes.ravel(), kind='stable')
+        probe_offsets = np.searchsorted(probes.ravel()[query_order], np.arange(len(self.lists) + 1))
+
+        for list_id, members in enumerate(self.lists):
+            rows = query_order[probe_offsets[list_id]:probe_offsets[list_id + 1]] // nprobe
+            if len(rows) == 0 or len(members) == 0:
+                continue
+
+            list_scores = queries[rows] @ self.embedding[members].T
+            list_ids = np.broadcast_to(members, list_scores.shape)
+            if exclude is not None:
+                list_scores[list_ids == np.asarray(exclude)[rows, None]] = -np.inf
+
+            ids[rows], scores[rows] = _top_k_merge(ids[rows], scores[rows], list_ids, list_scores, k)
+
+        ids[np.isneginf(scores)] = -1
+
+        return ids.astype(np.int32), scores
+
+    def all_neighbors(self, k=20, nprobe=None, chunk_size=4096):
+        """
+        Method to find the 'k' closest embeddings of every indexed embedding,
+        itself excluded. Rows whose probed lists hold fewer than 'k'
+        embeddings are searched again in all the lists.
+        """
+
+        n_rows = len(self.embedding)
+        ids = np.empty((n_rows, k), dtype=np.int32)
+        scores = np.empty((n_rows, k), dtype=np.float32)
+
+        for start in range(0, n_rows, chunk_size):
+            rows = np.arange(start, min(start + chunk_size, n_rows))
+            ids[rows], scores[rows] = self.search(self.embedding[rows], k, nprobe, exclude=rows)
+
+        incomplete = np.flatnonzero((ids < 0).any(axis=1))
+        if len(incomplete):
+            ids[incomplete], scores[incomplete] = self.search(self.embedding[incomplete], k, len(self.lists),
+                                                              exclude=incomplete)
+
+        return ids, scores
+
+
+def rerank(vectors, ids, k, chunk_size=256):
+    """
+    Function to re-score candidate neighbors [n, c] with the exact cosine
+    similarity of the (sparse) feature vectors and keep the 'k' best.
+    Candidates -1 are ignored. Rows are processed by chunks of 'chunk_size',
+    so only chunk_size x c candidate vectors are gathered at a time.
+    """
+
+    vectors = normalize(vectors, norm='l2', axis=1)
+    n_rows, n_candidates = ids.shape
+    k = min(k, n_candidates)
+
+    top_ids = np.empty((n_rows, k), dtype=ids.dtype)
+    top_scores = np.empty((n_rows, k), dtype=np.float32)
+    empty_ids = np.empty((0, 0), dtype=ids.dtype)
+    empty_scores = np.empty((0, 0), dtype=np.float32)
+
+    for start in range(0, n_rows, chunk_size):
+        stop = min(start + chunk_size, n_rows)
+        chunk_ids = ids[start:stop]
+        rows = np.repeat(np.arange(start, stop), n_candidates)
+
+        exact = vectors[rows].multiply(vectors[np.maximum(chunk_ids.ravel(), 0)]).sum(axis=1)
+        exact = np.asarray(exact, dtype=np.float32).reshape(chunk_ids.shape)
+        exact[chunk_ids < 0] = -np.inf
+
+        top_ids[start:stop], top_scores[start:stop] = _top_k_merge(
+            empty_ids.reshape(stop - start, 0), empty_scores.reshape(stop - start, 0), chunk_ids, exact, k)
+
+    return top_ids, top_scores
+
+
+def ann_top_k(vectors, k=20, n_components=128, n_lists=None, nprobe=8, candidates=4, seed=0):
+    """
+    Function to compute approximately the 'k' most cosine-similar rows of
+    every row of a (sparse) feature matrix, with the same output as
+    'similarity_index.top_k_cosine': the rows are embedded with a truncated
+    SVD, searched with an IVF index probing 'nprobe' lists, and the
+    'candidates' x k best candidates are re-scored with the exact cosine
+    similarity ('candidates' = 0 keeps the embedding scores).
+    """
+
+    k = min(k, vectors.shape[0] - 1)
+    index = IVFIndex(n_lists, nprobe, seed=seed).fit(embed(vectors, n_components, seed))
+
+    if not candidates:
+        return index.all_neighbors(k)
+
+    ids, _ = index.all_neighbors(k * candidates)
+
+    return rerank(vectors, ids, k)
+
+
+def text_ann_top_k(texts, k=20, **ann_params):
+    """
+    Function to compute approximately the 'k' most similar texts of every
+    text, like 'similarity_index.text_top_k' (token counts, English stop
+    words removed), with 'ann_top_k'.
+    """
+
+    unique_texts, inverse = np.unique(np.asarray(texts, dtype=str), return_inverse=True)
+    count_matrix = CountVectorizer(stop_words='english').fit_transform(unique_texts)
+
+    return ann_top_k(count_matrix[inverse.ravel()], k, **ann_params)
+
+
+def recall(ids, scores, exact_scores):
+    """
+    Function to compute the recall of approximate neighbors against the
+    exact top-K: share of the approximate neighbors that are at least as
+    similar as the exact K-th neighbor (so ties count as found).
+    'scores' must be exact similarities (e.g. re-ranked).
+    """
+
+    threshold = exact_scores[:, -1:] - 1e-6
+
+    return float(np.mean((scores >= threshold) & (ids >= 0)))
+
+
+def benchmark(vectors, k=20, nprobes=(1, 2, 4, 8, 16), n_components=128, candidates=4, seed=0):
+    """
+    Function to compare 'ann_top_k' with the exact 'top_k_cosine' on the
+    same vectors, for several numbers of probed lists. Returns a dataframe
+    with the recall@k and the time in seconds of each setting.
+    """
+
+    start = time.time()
+    _, exact_scores = top_k_cosine(vectors, k)
+    rows = [{'method': 'exact', 'nprobe': None, 'recall@{}'.format(k): 1.0,
+             'seconds': time.time() - start}]
+
+    for nprobe in nprobes:
+        start = time.time()
+        ids, _ = ann_top_k(vectors, k, n_components, nprobe=nprobe, candidates=candidates, seed=seed)
+        seconds = time.time() - start
+
+        # Exact similarity of the neighbors found, to measure the recall.
+        _, scores = rerank(vectors, ids, ids.shape[1])
+        rows.append({'method': 'ivf', 'nprobe': nprobe,
+                     'recall@{}'.format(k): recall(ids, scores, exact_scores), 'seconds': seconds})
+
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    # Benchmark on the plot vectors saved by Model_similarity:
+    #   python ann_index.py sim_model
+    model_location = sys.argv[1] if len(sys.argv) > 1 else 'sim_model'
+    plot_vectors = sparse.load_npz(model_location + '/vectors.npz')
+    with open(model_location + '/keys.json', encoding='utf-8') as f:
+        print('Games: {}'.format(len(json.load(f))))
+    print(benchmark(plot_vectors))
@@ -1,6 +1,8 @@
 import streamlit as st
 import pandas as pd
 import textwrap
+from similarity_index import NeighborIndex
+from table_io import read_table
 import random
 
 # Get URL query parameters
@@ -94,11 +96,16 @@ st.markdown(
 
 @st.cache_data(persist=True)
 def getdata():
-    games_df = pd.read_csv('Games_dataset.csv', index_col=0)
-    similarity_df = pd.read_csv('sim_matrix.csv', index_col=0)
-    return games_df, similarity_df
+    games_df = read_table('Games_dataset.csv', index_col=0)
+    return games_df
 
-games_df, similarity_df = getdata()
+# Load the precomputed top-K neighbor index once per process, and again when a rebuild saved a new version
+@st.cache_resource(max_entries=1)
+def getindex(version):
+    return NeighborIndex.load('sim_index')
+
+games_df = getdata()
+neighbor_index = getindex(NeighborIndex.version('sim_index'))
 
 # Standardize game titles to lowercase for comparison
 games_df['lower_title'] = games_df['Title'].str.lower()
@@ -116,14 +123,15 @@ if default_game:
         # Retrieve the selected game’s data from games_df
         selected_game_data = games_df[games_df['lower_title'] == default_game_lower]
         selected_game_title = selected_game_data['Title'].values[0]
+        # Titles may repeat, the neighbor index is keyed by the wiki link of each game
+        selected_game_link = selected_game_data['Link'].values[0]
         
-        # Check if the selected game exists in similarity_df
-        if selected_game_title in similarity_df.columns:
+        # Check if the selected game exists in the neighbor index
+        if selected_game_link in neighbor_index:
             # Retrieve game recommendations
-            link = 'https://en.wikipedia.org' + selected_game_data['Link'].values[0]
-            matches = similarity_df[selected_game_title].sort_values()[1:6]
-            matches = matches.index.tolist()
-            matches = games_df.set_index('Title').loc[matches]
+            link = 'https://en.wikipedia.org' + selected_game_link
+            matches = neighbor_index.neighbors(selected_game_link, 5, keys=True)
+            matches = games_df.set_index('Link').loc[matches]
             matches.reset_index(inplace=True)
 
             st.markdown(f"# The recommended games for [{selected_game_title}]({link}) are:")
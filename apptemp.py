@@ -1,6 +1,8 @@
 import streamlit as st
 import pandas as pd
 import textwrap
+from similarity_index import NeighborIndex
+from table_io import read_table
 
 st.header(
     """ 
@@ -34,11 +36,16 @@ st.markdown(
 # Load and Cache the data
 @st.cache_data(persist=True)
 def getdata():
-    games_df = pd.read_csv('Games_dataset.csv', index_col=0)
-    similarity_df = pd.read_csv('sim_matrix.csv', index_col=0)
-    return games_df, similarity_df
+    games_df = read_table('Games_dataset.csv', index_col=0)
+    return games_df
 
-games_df, similarity_df = getdata()
+# Load the precomputed top-K neighbor index once per process, and again when a rebuild saved a new version
+@st.cache_resource(max_entries=1)
+def getindex(version):
+    return NeighborIndex.load('sim_index')
+
+games_df = getdata()
+neighbor_index = getindex(NeighborIndex.version('sim_index'))
 
 # Standardize game titles to lowercase for comparison
 games_df['lower_title'] = games_df['Title'].str.lower()
@@ -69,12 +76,13 @@ selected_game = st.selectbox(
 
 # Recommendations
 if selected_game:
-    link = 'https://en.wikipedia.org' + games_df[games_df.Title == selected_game].Link.values[0]
+    # Titles may repeat, the neighbor index is keyed by the wiki link of each game
+    selected_link = games_df[games_df.Title == selected_game].Link.values[0]
+    link = 'https://en.wikipedia.org' + selected_link
 
     # DF query
-    matches = similarity_df[selected_game].sort_values()[1:6]
-    matches = matches.index.tolist()
-    matches = games_df.set_index('Title').loc[matches]
+    matches = neighbor_index.neighbors(selected_link, 5, keys=True)
+    matches = games_df.set_index('Link').loc[matches]
     matches.reset_index(inplace=True)
     
     # Prepare response data
@@ -4,6 +4,7 @@ import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import seaborn as sns
+from table_io import read_table
 
 # Load Matplotlib default settings.
 mpl.rcParams.update(mpl.rcParamsDefault)
@@ -18,7 +19,7 @@ def box_plot(csv_file, plot_file, nb_games=20):
 
     # Load user data.
     csv_location = pathlib.Path(csv_file)
-    df_data_users = pd.read_csv(csv_location)
+    df_data_users = read_table(csv_location)
 
     # Get column names from csv.
     col_names = df_data_users.columns
@@ -1,7 +1,26 @@
+import hashlib
 import implicit
+import json
 import pathlib
+import shutil
+import numpy as np
 import pandas as pd
 import scipy.sparse as sparse
+from table_io import read_table
+
+
+def data_fingerprint(data_path, block_size=1 << 20):
+    """
+    Function to compute the content hash (sha1) of a training data file, to
+    detect that a saved model was trained on other data.
+    """
+
+    digest = hashlib.sha1()
+    with open(data_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
 
 
 class ImplicitCollaborativeRecommender:
@@ -30,25 +49,51 @@ class ImplicitCollaborativeRecommender:
     # Original column names
     __user_o, __item_o, __impl_o = None, None, None
 
-    # Data and lookup tables.
+    # Data, fingerprint of its file and lookup tables.
     data, lookup_users, lookup_items = None, None, None
+    __data_fingerprint = None
+
+    # Id maps: 'user'/'item' -> internal id (dict, and pandas index for
+    # vectorized lookups) and internal id -> 'user'/'item' (array indexed by
+    # internal id).
+    __user_ids, __item_ids, __users, __items = None, None, None, None
+    __user_index = None
 
     # Model and sparse matrices.
     __model, __m_user_item, __m_item_user = None, None, None
 
-    def __init__(self, data_path=None):
+    # ALS model parameters.
+    __factors, __regularization, __iterations, __alpha = 20, 0.1, 20, 15
+
+    # Version of the on-disk model artifact written by 'save_model'.
+    __artifact_version = 1
+
+    def __init__(self, data_path=None, model_path=None):
         """
         Class initialization.
-        If a path to the csv dataset is provided, the dataset is loaded and the
-        ALS model is created. Otherwise, not.
+        If a path to a saved model is provided and exists, the model is loaded
+        from it, unless it was trained on another version of the csv dataset
+        'data_path' (content hash). Otherwise, if a path to the csv dataset is
+        provided, the dataset is loaded and the ALS model is created (and
+        saved to 'model_path' when given). Otherwise, not.
         """
 
+        if model_path is not None and pathlib.Path(model_path).exists():
+            if data_path is None or self.saved_fingerprint(model_path) == data_fingerprint(data_path):
+                self.load_saved_model(model_path)
+                return
+            print('\nTraining data changed since the model in {} was saved, '
+                  'fitting it again.'.format(model_path))
+
         if data_path is not None:
             self.load_data(data_path)
 
         if self.data is not None:
             self.load_model()
 
+            if model_path is not None:
+                self.save_model(model_path)
+
     def load_data(self, data_path):
         """
         Method to load data from input csv. Data are arranged in order to
@@ -56,8 +101,10 @@ class ImplicitCollaborativeRecommender:
            ['user_id'] ['item_id'] ['implicit measure']
         Original 'user' and 'item' information are replaced by codes.
         Two look up tables are generated in order to keep track of the
-        'user'-'user_id' and 'item'-'item_id'. Information in these lookup
-        tables is provided as strings.
+        'user'-'user_id' and 'item'-'item_id'. Internal ids are kept as
+        integer category codes, and the lookup tables are sorted by them.
+        Hash maps ('user'/'item' -> id) and arrays (id -> 'user'/'item') are
+        built alongside so that ids are translated in constant time.
 
         Note:
         The 'user_id' and 'item_id' used in the code refer to internal column
@@ -65,7 +112,8 @@ class ImplicitCollaborativeRecommender:
         """
 
         # Load training data.
-        df_data = pd.read_csv(pathlib.Path(data_path))
+        df_data = read_table(pathlib.Path(data_path))
+        self.__data_fingerprint = data_fingerprint(data_path)
 
         # Column numbers.
         col_user = df_data.columns[0]  # Name of column 'user'.
@@ -82,15 +130,22 @@ class ImplicitCollaborativeRecommender:
         print(df_data.isna().sum(axis=0))
 
         # Convert 'user' and 'item' into numerical ID.
-        df_data[col_user_intl] = df_data[col_user].astype('category').cat.codes
-        df_data[col_item_intl] = df_data[col_item].astype('category').cat.codes
+        df_data[col_user] = df_data[col_user].astype(int)
+        user_category = df_data[col_user].astype('category')
+        item_category = df_data[col_item].astype('category')
+        df_data[col_user_intl] = user_category.cat.codes
+        df_data[col_item_intl] = item_category.cat.codes
+
+        # The categories, ordered by code, give the 'user_id - user' and
+        # 'item_id - item' relations.
+        users = user_category.cat.categories.values
+        items = item_category.cat.categories.astype(str).values.astype(object)
 
         # Create lookup tables for 'user_id - user' and 'item_id - item'.
-        lookup_user = df_data[[col_user_intl, col_user]].drop_duplicates()
-        lookup_user[col_user_intl] = lookup_user[col_user_intl].astype(str)
-        lookup_user[col_user] = lookup_user[col_user].astype(int).astype(str)
-        lookup_game = df_data[[col_item_intl, col_item]].drop_duplicates()
-        lookup_game[col_item_intl] = lookup_game[col_item_intl].astype(str)
+        lookup_user = pd.DataFrame({col_user_intl: np.arange(len(users)),
+                                    col_user: users})
+        lookup_game = pd.DataFrame({col_item_intl: np.arange(len(items)),
+                                    col_item: items})
 
         # Clean dataframe with columns: 'user_id', 'item_id' and 'implicit
         # measure'.
@@ -107,10 +162,62 @@ class ImplicitCollaborativeRecommender:
         self.data = df_data
         self.lookup_users = lookup_user
         self.lookup_items = lookup_game
+        self.__set_id_maps(users, items)
         self.__user_o = col_user
         self.__item_o = col_item
         self.__impl_o = col_impl
 
+    def __set_id_maps(self, users, items):
+        """
+        Method to build the id maps from the arrays of 'user' and 'item'
+        ordered by internal id.
+        """
+
+        self.__users = users
+        self.__items = items
+        self.__user_ids = {int(user): user_id for user_id, user in enumerate(users)}
+        self.__user_index = pd.Index(np.asarray(users, dtype=np.int64))
+        self.__item_ids = {str(item): item_id for item_id, item in enumerate(items)}
+
+    def __user_id(self, user):
+        """
+        Method to translate a 'user' into its internal id. Returns -1 if the
+        user is unknown.
+        """
+
+        try:
+            return self.__user_ids.get(int(user), -1)
+        except (TypeError, ValueError):
+            return -1
+
+    def __user_ids_of(self, users):
+        """
+        Method to translate many 'users' into their internal ids with one
+        vectorized lookup. Users that are not integers (e.g. 12.5 or 'abc')
+        or are unknown get -1.
+        """
+
+        values = pd.to_numeric(pd.Series(users, dtype=object), errors='coerce')
+        if pd.api.types.is_integer_dtype(values):
+            # Integers are looked up as they are (no float rounding of large ids).
+            return self.__user_index.get_indexer(values.values.astype(np.int64)).astype(np.int64)
+
+        values = values.values.astype(float)
+        integral = np.isfinite(values) & (values == np.floor(values))
+
+        user_ids = np.full(len(values), -1, dtype=np.int64)
+        user_ids[integral] = self.__user_index.get_indexer(values[integral].astype(np.int64))
+
+        return user_ids
+
+    def __item_id(self, item):
+        """
+        Method to translate an 'item' into its internal id. Returns -1 if the
+        item is unknown.
+        """
+
+        return self.__item_ids.get(str(item), -1)
+
     def load_model(self):
         """
         Method to create the ALS model using the 'implicit' library in order
@@ -146,12 +253,12 @@ class ImplicitCollaborativeRecommender:
                                                    df_data[col_item_intl])))
 
             # Initialize the als model and fit it using the sparse item-user matrix
-            model = implicit.als.AlternatingLeastSquares(factors=20,
-                                                         regularization=0.1,
-                                                         iterations=20)
+            model = implicit.als.AlternatingLeastSquares(factors=self.__factors,
+                                                         regularization=self.__regularization,
+                                                         iterations=self.__iterations)
 
             # Calculate the confidence by multiplying it the the defined alpha value.
-            alpha_val = 15
+            alpha_val = self.__alpha
             data_conf = (sparse_item_user * alpha_val).astype('double')
 
             # Fit data to the model
@@ -167,6 +274,221 @@ class ImplicitCollaborativeRecommender:
             self.__m_item_user = None
             self.__m_user_item = None
 
+    def fold_in(self, df_events):
+        """
+        Method to fold new interactions into the fitted model without
+        retraining it. 'df_events' should have the same column order as the
+        training data:
+          [user] [item] [implicit measure]
+        Unknown users are appended to the lookup tables. The 'implicit
+        measure' of each event is added to the user-item matrix, and the
+        factors of every user involved are solved again against the fixed
+        item factors, using the same confidence weighting as the fit.
+        Events on items that are not part of the model are ignored.
+        """
+
+        model = self.__model
+        m_user_item = self.__m_user_item
+        n_users, n_items = m_user_item.shape
+
+        # Column numbers.
+        col_user = df_events.columns[0]
+        col_item = df_events.columns[1]
+        col_impl = df_events.columns[2]
+
+        # Translate items, ignoring those the model does not know.
+        item_ids = np.array([self.__item_id(item) for item in df_events[col_item]],
+                            dtype=np.int64)
+        known = item_ids >= 0
+        print('\nEvents ignored (unknown item): {}'.format(int((~known).sum())))
+        df_events = df_events.loc[known]
+        item_ids = item_ids[known]
+
+        # Translate users, giving new ids to the unknown ones.
+        events_users = df_events[col_user].astype(int).values
+        user_ids = self.__user_ids_of(events_users)
+        new_users = pd.unique(events_users[user_ids < 0])
+        if len(new_users) > 0:
+            users = np.concatenate([self.__users, new_users])
+            self.__set_id_maps(users, self.__items)
+            self.lookup_users = pd.DataFrame({self.__user_intl: np.arange(len(users)),
+                                              self.__user_o: users})
+            user_ids = self.__user_ids_of(events_users)
+        print('Users folded in: {} ({} new)'.format(len(np.unique(user_ids)),
+                                                    len(new_users)))
+
+        # Add the new interactions to the user-item matrix.
+        n_users_all = len(self.__users)
+        measure = df_events[col_impl].astype(float).values
+        m_delta = sparse.csr_matrix((measure, (user_ids, item_ids)),
+                                    shape=(n_users_all, n_items))
+        m_user_item = sparse.vstack([m_user_item,
+                                     sparse.csr_matrix((n_users_all - n_users, n_items))])
+        m_user_item = (m_user_item.tocsr() + m_delta).tocsr()
+
+        # Keep the training data in line, if it is loaded.
+        if self.data is not None:
+            df_new = pd.DataFrame({self.__user_intl: user_ids,
+                                   self.__item_intl: item_ids,
+                                   self.__impl_intl: measure})
+            self.data = pd.concat([self.data, df_new], ignore_index=True)
+
+        # Solve the factors of the affected users against the fixed item
+        # factors: (YtY + Yu^T (Cu - I) Yu + reg * I) x = Yu^T Cu p(u).
+        item_factors = np.asarray(model.item_factors, dtype=np.float64)
+        n_factors = item_factors.shape[1]
+        yty_reg = item_factors.T @ item_factors + \
+            self.__regularization * np.eye(n_factors)
+
+        affected = np.unique(user_ids)
+        m_affected = m_user_item[affected]
+        a_matrices = np.empty((len(affected), n_factors, n_factors))
+        b_vectors = np.empty((len(affected), n_factors))
+        for row in range(len(affected)):
+            start, stop = m_affected.indptr[row], m_affected.indptr[row + 1]
+            factors_u = item_factors[m_affected.indices[start:stop]]
+            confidence = m_affected.data[start:stop] * self.__alpha
+            a_matrices[row] = yty_reg + (factors_u.T * (confidence - 1)) @ factors_u
+            b_vectors[row] = factors_u.T @ confidence
+
+        solved = np.linalg.solve(a_matrices, b_vectors[..., None])[..., 0]
+
+        # Append rows for new users and write the solved factors.
+        user_factors = np.asarray(model.user_factors)
+        user_factors = np.vstack([user_factors,
+                                  np.zeros((n_users_all - n_users, n_factors),
+                                           dtype=user_factors.dtype)])
+        user_factors[affected] = solved
+
+        # Assign results to class variables.
+        model.user_factors = user_factors
+        self.__m_user_item = m_user_item
+        self.__m_item_user = m_user_item.T.tocsr()
+
+    def save_model(self, model_path):
+        """
+        Method to save the fitted model to a directory, so that it can be
+        reloaded with 'load_saved_model' instead of being trained again. The
+        directory contains:
+          meta.json            artifact version, column names, parameters
+                               and fingerprint of the training data
+          user_factors.npy     [n_users, factors] ALS user factors
+          item_factors.npy     [n_items, factors] ALS item factors
+          user_item_*.npy      data, indices and indptr of the user-item CSR
+          users.npy, items.npy 'user' and 'item' ordered by internal id
+        All arrays are plain numpy files that can be memory-mapped.
+        The artifact is written to a temporary directory renamed into place
+        once complete, so an interrupted save never leaves a partial model.
+        """
+
+        path = pathlib.Path(model_path)
+        partial = path.with_name(path.name + '.part')
+        shutil.rmtree(partial, ignore_errors=True)
+        partial.mkdir(parents=True)
+
+        model = self.__model
+        m_user_item = self.__m_user_item.tocsr()
+
+        np.save(partial / 'user_factors.npy', np.asarray(model.user_factors))
+        np.save(partial / 'item_factors.npy', np.asarray(model.item_factors))
+        np.save(partial / 'user_item_data.npy', m_user_item.data)
+        np.save(partial / 'user_item_indices.npy', m_user_item.indices)
+        np.save(partial / 'user_item_indptr.npy', m_user_item.indptr)
+        np.save(partial / 'users.npy', np.asarray(self.__users, dtype=np.int64))
+        np.save(partial / 'items.npy', np.asarray(self.__items, dtype=str))
+
+        meta = {'version': self.__artifact_version,
+                'columns': [self.__user_o, self.__item_o, self.__impl_o],
+                'shape': list(m_user_item.shape),
+                'factors': self.__factors,
+                'regularization': self.__regularization,
+                'iterations': self.__iterations,
+                'alpha': self.__alpha,
+                'data_fingerprint': self.__data_fingerprint}
+        with open(partial / 'meta.json', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        # Swap the complete artifact in place of the previous one.
+        previous = path.with_name(path.name + '.old')
+        shutil.rmtree(previous, ignore_errors=True)
+        if path.exists():
+            path.rename(previous)
+        partial.rename(path)
+        shutil.rmtree(previous, ignore_errors=True)
+
+    @staticmethod
+    def saved_fingerprint(model_path):
+        """
+        Method to read the fingerprint of the training data of a model saved
+        with 'save_model' (None if it was not recorded).
+        """
+
+        meta_file = pathlib.Path(model_path) / 'meta.json'
+        if not meta_file.exists():
+            return None
+
+        with open(meta_file, encoding='utf-8') as f:
+            return json.load(f).get('data_fingerprint')
+
+    def load_saved_model(self, model_path, mmap_mode='r'):
+        """
+        Method to load a model saved with 'save_model'. Factors and the
+        user-item matrix are memory-mapped by default ('mmap_mode'), so
+        loading does not depend on the size of the model.
+        The training data itself is not part of the artifact, 'data' is left
+        empty.
+        """
+
+        path = pathlib.Path(model_path)
+
+        with open(path / 'meta.json', encoding='utf-8') as f:
+            meta = json.load(f)
+
+        if meta['version'] != self.__artifact_version:
+            raise ValueError('Unsupported model artifact version {} in {} '
+                             '(expected {}).'.format(meta['version'], path,
+                                                     self.__artifact_version))
+
+        # Rebuild the model from its factors.
+        model = implicit.als.AlternatingLeastSquares(factors=meta['factors'],
+                                                     regularization=meta['regularization'],
+                                                     iterations=meta['iterations'])
+        model.user_factors = np.load(path / 'user_factors.npy', mmap_mode=mmap_mode)
+        model.item_factors = np.load(path / 'item_factors.npy', mmap_mode=mmap_mode)
+
+        # Rebuild the sparse matrices: user-item and item-user.
+        sparse_user_item = sparse.csr_matrix(
+            (np.load(path / 'user_item_data.npy', mmap_mode=mmap_mode),
+             np.load(path / 'user_item_indices.npy', mmap_mode=mmap_mode),
+             np.load(path / 'user_item_indptr.npy', mmap_mode=mmap_mode)),
+            shape=tuple(meta['shape']))
+
+        # Rebuild lookup tables and id maps.
+        col_user, col_item, col_impl = meta['columns']
+        users = np.load(path / 'users.npy')
+        items = np.load(path / 'items.npy').astype(object)
+        lookup_user = pd.DataFrame({self.__user_intl: np.arange(len(users)),
+                                    col_user: users})
+        lookup_game = pd.DataFrame({self.__item_intl: np.arange(len(items)),
+                                    col_item: items})
+
+        # Assign results to class variables.
+        self.data = None
+        self.lookup_users = lookup_user
+        self.lookup_items = lookup_game
+        self.__set_id_maps(users, items)
+        self.__user_o = col_user
+        self.__item_o = col_item
+        self.__impl_o = col_impl
+        self.__factors = meta['factors']
+        self.__regularization = meta['regularization']
+        self.__iterations = meta['iterations']
+        self.__alpha = meta['alpha']
+        self.__data_fingerprint = meta.get('data_fingerprint')
+        self.__model = model
+        self.__m_user_item = sparse_user_item
+        self.__m_item_user = sparse_user_item.T.tocsr()
+
     def similar_items(self, items, n_similar):
         """
         Method to find the 'n' most similar items to the chosen 'item_id'.
@@ -176,31 +498,23 @@ class ImplicitCollaborativeRecommender:
         """
 
         model = self.__model
-        lookup_items = self.lookup_items
+        item_names_all = self.__items
         n_similar = n_similar + 1
 
         # Retrieve column names.
-        col_item_intl = self.__item_intl
         col_item_o = self.__item_o
 
         # Use implicit library methods to get similar items.
         output = []
         for item in items:
-            item_id = lookup_items[col_item_intl]. \
-                loc[lookup_items[col_item_o] == str(item)]
+            item_id = self.__item_id(item)
 
-            if item_id.empty:
+            if item_id < 0:
                 item_names = [-999] * n_similar
             else:
-                item_id = item_id.to_string(index=False).strip()
-                similar = model.similar_items(int(item_id), n_similar)
-
-                item_names = []
-                for item_id_r, score in similar:
-                    item_name = lookup_items[col_item_o]. \
-                        loc[lookup_items[col_item_intl] == str(item_id_r)]. \
-                        to_string(index=False).strip()
-                    item_names.append(item_name)
+                similar = model.similar_items(item_id, n_similar)
+                item_names = [item_names_all[item_id_r]
+                              for item_id_r, score in similar]
 
             output.append(item_names)
 
@@ -219,36 +533,25 @@ class ImplicitCollaborativeRecommender:
         """
 
         model = self.__model
-        lookup_users = self.lookup_users
-        lookup_items = self.lookup_items
+        item_names_all = self.__items
 
         # Retrieve column names.
-        col_user_intl = self.__user_intl
         col_user_o = self.__user_o
-        col_item_intl = self.__item_intl
-        col_item_o = self.__item_o
 
         # Use the implicit library recommend method.
         output = []
         for user in users:
-            user_id = lookup_users[col_user_intl]. \
-                loc[lookup_users[col_user_o] == str(user)]
+            user_id = self.__user_id(user)
 
-            if user_id.empty:
+            if user_id < 0:
                 item_names = [-999] * n_recommendation
             else:
-                user_id = user_id.to_string(index=False).strip()
-                recommended = model.recommend(int(user_id),
+                recommended = model.recommend(user_id,
                                               self.__m_user_item,
                                               n_recommendation,
                                               False)
-
-                item_names = []
-                for item_id, score in recommended:
-                    item_name = lookup_items[col_item_o]. \
-                        loc[lookup_items[col_item_intl] == str(item_id)]. \
-                        to_string(index=False).strip()
-                    item_names.append(item_name)
+                item_names = [item_names_all[item_id]
+                              for item_id, score in recommended]
 
             output.append([user, *item_names])
 
@@ -259,17 +562,67 @@ class ImplicitCollaborativeRecommender:
 
         return df_recommendation
 
+    def recommend_batch(self, users, n_recommendation, batch_size=4096):
+        """
+        Vectorized version of the method 'recommend' to recommend 'n' items
+        to many 'users' at once. All users are mapped to their internal ids in
+        one step and scored by blocks of 'batch_size' users with a single
+        matrix product against the item factors. The top 'n' items of each
+        user are selected with a partial sort.
+        Results are returned as a dataframe with the same layout as
+        'recommend':
+          [user_id] [1] [2] [3] [4] .... [n]
+        """
+
+        model = self.__model
+        item_names = self.__items
+
+        # Retrieve column names.
+        col_user_o = self.__user_o
+
+        # Map every user to its internal id (-1 if unknown).
+        users = list(users)
+        user_ids = self.__user_ids_of(users)
+
+        # Score known users by blocks and keep the top 'n' items of each.
+        known = np.flatnonzero(user_ids >= 0)
+        top_items = np.empty((len(known), n_recommendation), dtype=np.int64)
+        item_factors = model.item_factors
+        for start in range(0, len(known), batch_size):
+            block = user_ids[known[start:start + batch_size]]
+            scores = model.user_factors[block] @ item_factors.T
+
+            top = np.argpartition(-scores, n_recommendation - 1,
+                                  axis=1)[:, :n_recommendation]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            top_items[start:start + len(block)] = \
+                np.take_along_axis(top, order, axis=1)
+
+        # Unknown users keep a row of '-999', as in 'recommend'.
+        output = np.full((len(users), n_recommendation), -999, dtype=object)
+        output[known] = item_names[top_items]
+
+        # Create dataframe to store recommendations.
+        col_names = list(map(str, range(1, n_recommendation + 1)))
+        df_recommendation = pd.DataFrame(output, columns=col_names)
+        df_recommendation.insert(0, col_user_o, users)
+
+        return df_recommendation
+
 
 if __name__ == "__main__":
     # Get users from test data for which recommendations will be generated.
     test_location = r'../../data/model_data/steam_user_test.csv'
-    df_test = pd.read_csv(test_location)
+    df_test = read_table(test_location)
     list_users = df_test['user_id'].unique()
 
-    # Create collaborative recommender model (ALS).
+    # Create collaborative recommender model (ALS). The fitted model is saved
+    # on the first run and reloaded afterwards.
     train_location = r'../../data/model_data/steam_user_train.csv'
-    f_implicit = ImplicitCollaborativeRecommender(train_location)
+    model_location = r'../../data/model_data/als_model'
+    f_implicit = ImplicitCollaborativeRecommender(train_location, model_location)
     # df_sim = f_implicit.similar_items(['Dota 2', 'xxxxx', 'Fallout 4', 'Left 4 Dead 2'], 20)
-    df_rec = f_implicit.recommend(list_users, 20)
+    df_rec = f_implicit.recommend_batch(list_users, 20)
     df_rec.to_csv(r'../../data/output_data/Collaborative_recommender_als_output.csv',
                   index=False)
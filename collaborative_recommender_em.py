@@ -0,0 +1,493 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sparse
+from scipy.sparse.linalg import LinearOperator, svds
+from sklearn.mixture import GaussianMixture
+import evaluation
+from parallel import process_map
+
+
+def user_item_matrix(df_data, value_col, shape, user_col='user_id', item_col='game_id'):
+    """
+    Function to build the sparse user-item matrix (CSR) in one vectorized
+    step from the internal 'user_id' and 'game_id' columns of a dataframe.
+    Cells are filled with 'value_col'. If a (user, game) pair appears more
+    than once, the last value is kept, as a cell by cell assignment would do.
+    """
+
+    df_cells = df_data.drop_duplicates([user_col, item_col], keep='last')
+
+    return sparse.csr_matrix((df_cells[value_col].values.astype(float),
+                              (df_cells[user_col].values, df_cells[item_col].values)),
+                             shape=shape)
+
+
+def remove_entries(matrix, rows, cols):
+    """
+    Function to return a copy of a sparse matrix without the given cells,
+    e.g. to hold out test entries. Pairs outside the matrix are ignored.
+    """
+
+    rows, cols = np.asarray(rows), np.asarray(cols)
+    inside = (rows < matrix.shape[0]) & (cols < matrix.shape[1])
+    mask = sparse.csr_matrix((np.ones(inside.sum()), (rows[inside], cols[inside])),
+                             shape=matrix.shape).astype(bool)
+
+    matrix = matrix.tocsr() - matrix.multiply(mask).tocsr()
+    matrix.eliminate_zeros()
+
+    return matrix
+
+
+def indicator(matrix):
+    """
+    Function to return the 0/1 indicator (sparse) of the positive cells of a
+    sparse matrix.
+    """
+
+    matrix = (matrix > 0).astype(np.int8).tocsr()
+    matrix.eliminate_zeros()
+
+    return matrix
+
+
+class MaskedFactorization:
+    """
+    Class to factorize a sparse user-item matrix Y as U V^T, fitting only the
+    observed (stored) cells of Y:
+      loss = sum over observed (u, i) of (U[u] . V[i] - Y[u, i])^2
+             + regularization * (|U|^2 + |V|^2)
+    The residual on the observed cells is computed once per step and reused
+    for the loss and both gradients, so nothing of size users x games is
+    ever built.
+
+    Available training methods:
+      'gd'   full batch gradient descent, U and V updated together
+      'sgd'  mini-batch stochastic gradient descent over shuffled cells
+      'als'  alternating least squares (needs regularization > 0)
+    """
+
+    def __init__(self, n_factors=60, method='gd', learning_rate=0.001,
+                 regularization=0.0, n_iterations=200, batch_size=1024,
+                 init_scale=0.01, seed=None):
+        """
+        Class initialization with the training parameters.
+        """
+
+        if method not in ('gd', 'sgd', 'als'):
+            raise ValueError('Unknown training method: {}'.format(method))
+        if method == 'als' and regularization <= 0:
+            raise ValueError('The \'als\' method needs a positive regularization.')
+
+        self.n_factors = n_factors
+        self.method = method
+        self.learning_rate = learning_rate
+        self.regularization = regularization
+        self.n_iterations = n_iterations
+        self.batch_size = batch_size
+        self.init_scale = init_scale
+        self.seed = seed
+
+        self.user_factors, self.item_factors = None, None
+        self.loss_, self.rmse_ = [], []
+
+    def fit(self, matrix, eval_rows=None, eval_cols=None, eval_values=None,
+            progress=None):
+        """
+        Method to fit the factors to the observed cells of a sparse matrix.
+        If held-out cells are given ('eval_rows', 'eval_cols', 'eval_values')
+        their RMSE is recorded in 'rmse_' after every iteration, next to the
+        training loss in 'loss_' (both start with the value before training).
+        'progress' can wrap the iteration range (e.g. tqdm).
+        """
+
+        matrix = matrix.tocsr()
+        rng = np.random.default_rng(self.seed)
+
+        # Observed cells, in CSR order.
+        rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+        cols = matrix.indices
+        values = matrix.data.astype(float)
+
+        self.user_factors = rng.normal(0, self.init_scale, [matrix.shape[0], self.n_factors])
+        self.item_factors = rng.normal(0, self.init_scale, [matrix.shape[1], self.n_factors])
+        evaluate = eval_rows is not None
+
+        residual = self.__residual(rows, cols, values)
+        self.loss_ = [self.__loss(residual)]
+        self.rmse_ = [self.__rmse(eval_rows, eval_cols, eval_values)] if evaluate else []
+
+        iterations = range(self.n_iterations)
+        for _ in (progress(iterations) if progress is not None else iterations):
+            if self.method == 'gd':
+                self.__gd_step(matrix, residual)
+            elif self.method == 'sgd':
+                self.__sgd_epoch(rows, cols, values, rng)
+            else:
+                self.__als_step(matrix)
+
+            residual = self.__residual(rows, cols, values)
+            self.loss_.append(self.__loss(residual))
+            if evaluate:
+                self.rmse_.append(self.__rmse(eval_rows, eval_cols, eval_values))
+
+        return self
+
+    def predict(self, rows, cols):
+        """
+        Method to predict the value of the given cells.
+        """
+
+        return np.einsum('ij,ij->i', self.user_factors[rows], self.item_factors[cols])
+
+    def __residual(self, rows, cols, values):
+        return self.predict(rows, cols) - values
+
+    def __loss(self, residual):
+        loss = np.sum(residual ** 2)
+        if self.regularization > 0:
+            loss += self.regularization * (np.sum(self.user_factors ** 2) +
+                                           np.sum(self.item_factors ** 2))
+        return loss
+
+    def __rmse(self, rows, cols, values):
+        return evaluation.rmse(self.predict(rows, cols), values)
+
+    def __gd_step(self, matrix, residual):
+        # Residual as a sparse matrix with the same pattern as the data.
+        m_residual = sparse.csr_matrix((residual, matrix.indices, matrix.indptr),
+                                       shape=matrix.shape)
+        U, V, reg = self.user_factors, self.item_factors, self.regularization
+
+        grad_u = 2 * (m_residual @ V) + 2 * reg * U
+        grad_v = 2 * (m_residual.T @ U) + 2 * reg * V
+
+        self.user_factors = U - self.learning_rate * grad_u
+        self.item_factors = V - self.learning_rate * grad_v
+
+    def __sgd_epoch(self, rows, cols, values, rng):
+        U, V, reg, lr = self.user_factors, self.item_factors, self.regularization, self.learning_rate
+
+        order = rng.permutation(len(values))
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            r, c = rows[batch], cols[batch]
+            U_b, V_b = U[r], V[c]
+            error = np.einsum('ij,ij->i', U_b, V_b) - values[batch]
+
+            np.add.at(U, r, -lr * (2 * error[:, None] * V_b + 2 * reg * U_b))
+            np.add.at(V, c, -lr * (2 * error[:, None] * U_b + 2 * reg * V_b))
+
+    def __als_step(self, matrix):
+        self.user_factors = self.__solve_rows(matrix, self.item_factors)
+        self.item_factors = self.__solve_rows(matrix.T.tocsr(), self.user_factors)
+
+    def __solve_rows(self, matrix, fixed, batch_size=1024):
+        # Least squares of every row against the fixed factors of its observed
+        # cells: (F_o^T F_o + reg * I) x = F_o^T y_o, solved by batches of
+        # rows so only batch_size x f x f normal equations are held at once.
+        n_rows, n_factors = matrix.shape[0], fixed.shape[1]
+        solution = np.empty((n_rows, n_factors))
+        a_matrices = np.empty((batch_size, n_factors, n_factors))
+        b_vectors = np.empty((batch_size, n_factors))
+        eye_reg = self.regularization * np.eye(n_factors)
+
+        for batch_start in range(0, n_rows, batch_size):
+            batch_stop = min(batch_start + batch_size, n_rows)
+
+            for i, row in enumerate(range(batch_start, batch_stop)):
+                start, stop = matrix.indptr[row], matrix.indptr[row + 1]
+                fixed_o = fixed[matrix.indices[start:stop]]
+                a_matrices[i] = fixed_o.T @ fixed_o + eye_reg
+                b_vectors[i] = fixed_o.T @ matrix.data[start:stop]
+
+            n_batch = batch_stop - batch_start
+            solution[batch_start:batch_stop] = np.linalg.solve(a_matrices[:n_batch],
+                                                               b_vectors[:n_batch, :, None])[..., 0]
+
+        return solution
+
+
+class MeanImputedSVD:
+    """
+    Class to compute the 'n_factors' leading components of the SVD of a
+    sparse user-item matrix whose missing cells are imputed with the mean of
+    their column (missing cells count as 0 in the mean):
+      Y = S' + 1 mu^T
+    where mu holds the column means and S' is sparse, holding the observed
+    values minus the mean of their column. Y is only used through products
+    with vectors (scipy LinearOperator), so the dense imputed matrix is never
+    built, and only the leading components are solved for.
+
+    Available solvers:
+      'arpack', 'lobpcg', 'propack'  scipy.sparse.linalg.svds
+      'randomized'                   randomized range finder with power
+                                     iterations (Halko et al.)
+    """
+
+    def __init__(self, n_factors=60, solver='arpack', n_oversamples=10, n_iter=4, seed=None):
+        """
+        Class initialization with the solver parameters ('n_oversamples' and
+        'n_iter' are only used by the randomized solver).
+        """
+
+        if solver not in ('arpack', 'lobpcg', 'propack', 'randomized'):
+            raise ValueError('Unknown SVD solver: {}'.format(solver))
+
+        self.n_factors = n_factors
+        self.solver = solver
+        self.n_oversamples = n_oversamples
+        self.n_iter = n_iter
+        self.seed = seed
+
+        self.user_factors, self.item_factors, self.singular_values = None, None, None
+
+    @staticmethod
+    def imputed_operator(matrix):
+        """
+        Method to return the column mean imputed matrix of a sparse matrix as
+        a scipy LinearOperator, without densifying it.
+        """
+
+        matrix = sparse.csr_matrix(matrix, dtype=float)
+        means = np.asarray(matrix.sum(axis=0)).ravel() / matrix.shape[0]
+
+        centered = matrix.copy()
+        centered.data -= means[centered.indices]
+        centered_t = centered.T.tocsr()
+        ones = np.ones(matrix.shape[0])
+
+        def matmat(x):
+            x = x.reshape(matrix.shape[1], -1)
+            return centered @ x + np.outer(ones, means @ x)
+
+        def rmatmat(y):
+            y = y.reshape(matrix.shape[0], -1)
+            return centered_t @ y + np.outer(means, ones @ y)
+
+        return LinearOperator(matrix.shape, matvec=lambda x: matmat(x).ravel(),
+                              rmatvec=lambda y: rmatmat(y).ravel(), matmat=matmat,
+                              rmatmat=rmatmat, dtype=float)
+
+    def fit(self, matrix):
+        """
+        Method to compute the leading components. The factors are stored so
+        that Y ~ user_factors item_factors^T, with the singular values folded
+        into 'user_factors'; components are sorted by decreasing singular value.
+        """
+
+        operator = self.imputed_operator(matrix)
+
+        if self.solver == 'randomized':
+            u, d, vt = self.__randomized_svd(operator)
+        else:
+            u, d, vt = svds(operator, self.n_factors, solver=self.solver, random_state=self.seed)
+            order = np.argsort(-d)
+            u, d, vt = u[:, order], d[order], vt[order]
+
+        self.singular_values = d
+        self.user_factors = u * d
+        self.item_factors = vt.T
+
+        return self
+
+    def __randomized_svd(self, operator):
+        rng = np.random.default_rng(self.seed)
+        size = min(self.n_factors + self.n_oversamples, min(operator.shape))
+
+        # Orthonormal basis of the range of Y, refined by power iterations.
+        q, _ = np.linalg.qr(operator.matmat(rng.normal(size=(operator.shape[1], size))))
+        for _ in range(self.n_iter):
+            q, _ = np.linalg.qr(operator.rmatmat(q))
+            q, _ = np.linalg.qr(operator.matmat(q))
+
+        # SVD of the small projected matrix Q^T Y.
+        u, d, vt = np.linalg.svd(operator.rmatmat(q).T, full_matrices=False)
+
+        return (q @ u)[:, :self.n_factors], d[:self.n_factors], vt[:self.n_factors]
+
+    def predict(self, rows, cols):
+        """
+        Method to predict the value of the given cells.
+        """
+
+        return np.einsum('ij,ij->i', self.user_factors[rows], self.item_factors[cols])
+
+
+def _fit_mixture(task):
+    """
+    Function to fit a 1D Gaussian mixture (EM algorithm) to the values of one
+    group, with the initialization used in EM_Rating: means spread over the
+    range of the values and unit precisions. Components are returned sorted
+    by mean, as rows (key, component, weight, mean, variance).
+    """
+
+    key, values, nclass = task
+
+    mu_init = np.linspace(values.min(), values.max(), nclass).reshape(-1, 1)
+    sigma_init = np.array([1] * nclass).reshape(-1, 1, 1)
+    gaussian = GaussianMixture(n_components=nclass, means_init=mu_init,
+                               precisions_init=sigma_init).fit(values.reshape([-1, 1]))
+
+    means = gaussian.means_[:, 0]
+    variances = gaussian.covariances_.reshape(nclass)
+    order = np.argsort(means)
+
+    return [(key, component + 1, gaussian.weights_[i], means[i], variances[i])
+            for component, i in enumerate(order)]
+
+
+def fit_mixtures(groups, nclass, processes=None):
+    """
+    Function to fit a Gaussian mixture with 'nclass' components to each
+    (key, values) pair of 'groups', in a pool of 'processes' processes
+    (see 'parallel.process_map'). Groups with fewer than 'nclass' values
+    are skipped.
+    Returns a dataframe with the columns:
+      [key] [component] [weight] [mean] [variance]
+    Components are numbered from 1, by increasing mean.
+    """
+
+    tasks = [(key, np.asarray(values, dtype=float), nclass) for key, values in groups
+             if len(values) >= nclass]
+
+    results = process_map(_fit_mixture, tasks, processes=processes, chunksize=16)
+    rows = [row for result in results for row in result]
+
+    return pd.DataFrame(rows, columns=['key', 'component', 'weight', 'mean', 'variance'])
+
+
+def fit_game_mixtures(df_data, game_col, value_col, nclass, processes=None):
+    """
+    Function to fit the distribution of 'value_col' (e.g. log hours) of every
+    game with a Gaussian mixture, grouping the data by game only once. The
+    first column of the returned table is named after 'game_col'.
+    """
+
+    groups = ((game, values.values) for game, values in df_data.groupby(game_col)[value_col])
+
+    return fit_mixtures(groups, nclass, processes).rename(columns={'key': game_col})
+
+
+class PercentileScorer:
+    """
+    Class to score the predictions U V^T of blocks of users as the percentile
+    of each prediction within its game (column), like pandas
+    'rank(pct=True)' on the dense users x games prediction matrix, without
+    building that matrix.
+    Each game's column of predictions is computed and sorted once, by blocks
+    of games. By default the full sorted columns are kept (exact
+    percentiles, memory games x users float32, as large as the prediction
+    matrix). With 'n_quantiles' only that many quantiles of each column are
+    kept (approximate percentiles, memory games x n_quantiles), which can
+    change the order of near-equal scores.
+    'decimals' rounds the predictions as EM_Rating does before ranking.
+    """
+
+    def __init__(self, user_factors, item_factors, decimals=None, n_quantiles=None,
+                 block_size=256):
+        """
+        Class initialization: computes the sorted columns of predictions by
+        blocks of 'block_size' games.
+        """
+
+        self.user_factors = user_factors
+        self.item_factors = item_factors
+        self.decimals = decimals
+        self.n_users = user_factors.shape[0]
+
+        n_games = item_factors.shape[0]
+        n_kept = self.n_users if n_quantiles is None else min(n_quantiles, self.n_users)
+        kept = np.linspace(0, self.n_users - 1, n_kept).round().astype(int)
+        self.n_kept = n_kept
+
+        # Sorted predictions of each game, one row per game.
+        self.__columns = np.empty((n_games, n_kept), dtype=np.float32)
+        for start in range(0, n_games, block_size):
+            stop = min(start + block_size, n_games)
+            block = self.__round(user_factors @ item_factors[start:stop].T)
+            self.__columns[start:stop] = np.sort(block, axis=0)[kept].T
+
+    def __round(self, pred):
+        if self.decimals is not None:
+            pred = np.round(pred, self.decimals)
+        return pred.astype(np.float32)
+
+    def predict(self, rows):
+        """
+        Method to compute the predictions of the given users (rows) for all
+        games.
+        """
+
+        return self.__round(self.user_factors[rows] @ self.item_factors.T)
+
+    def score(self, rows):
+        """
+        Method to compute the percentile of the predictions of the given users
+        (rows) within each game, as an array [len(rows), games].
+        Ties get the average rank.
+        """
+
+        pred = self.predict(rows)
+        scores = np.empty(pred.shape, dtype=np.float32)
+
+        for game in range(pred.shape[1]):
+            column = self.__columns[game]
+            left = np.searchsorted(column, pred[:, game], side='left')
+            right = np.searchsorted(column, pred[:, game], side='right')
+            scores[:, game] = (left + right + 1) / 2
+
+        return scores / self.n_kept
+
+
+def top_n_items(scorer, owned, rows, n):
+    """
+    Function to select the 'n' best scored games of the given users (rows)
+    with a partial sort. Games marked in the sparse 'owned' matrix get a
+    score of 0, so they only come last. Returns an array [len(rows), n] of
+    game columns, best first (ties by column).
+    """
+
+    rows = np.asarray(rows)
+    scores = scorer.score(rows)
+
+    owned_rows = owned[rows].tocoo()
+    scores[owned_rows.row, owned_rows.col] = 0
+
+    n = min(n, scores.shape[1])
+    top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.lexsort((top, -top_scores), axis=1)
+
+    return np.take_along_axis(top, order, axis=1)
+
+
+def export_top_n(output_file, scorer, owned, rows, user_names, item_names, n=20,
+                 block_size=1024, fill=0):
+    """
+    Function to export the top 'n' games of many users to a csv file, by
+    blocks of 'block_size' users, writing the rows of each block as soon as
+    it is scored:
+      [user_id] [1] [2] [3] [4] .... [n]
+    'rows' gives the row of each user in the model (-1 if the user is not
+    part of it, its games are then filled with 'fill') and 'user_names' the
+    value written in the 'user_id' column.
+    """
+
+    rows = np.asarray(rows)
+    user_names = np.asarray(user_names)
+    item_names = np.asarray(item_names, dtype=object)
+    columns = ['user_id'] + ['{}'.format(i + 1) for i in range(n)]
+
+    pd.DataFrame(columns=columns).to_csv(output_file, index=None)
+    for start in range(0, len(rows), block_size):
+        block_rows = rows[start:start + block_size]
+        block = np.full((len(block_rows), n), fill, dtype=object)
+
+        known = block_rows >= 0
+        if known.any():
+            block[known] = item_names[top_n_items(scorer, owned, block_rows[known], n)]
+
+        df_block = pd.DataFrame(block, columns=columns[1:])
+        df_block.insert(0, 'user_id', user_names[start:start + block_size])
+        df_block.to_csv(output_file, mode='a', header=False, index=None)
@@ -1,126 +1,112 @@
-from pandas import read_csv, Series, DataFrame, concat
+from pandas import Series, DataFrame, factorize
 
+import numpy as np
+import os
 import pathlib
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from similarity_index import text_top_k
+from ann_index import text_ann_top_k
+from table_io import read_table
+from parallel import process_map
 
 n_recommendation = 20
 
-# Get games data from CSV
-locationGamesFile = pathlib.Path(r'../../data/intermediate_data/processed_games_for_content-based.csv')
-dataGames = read_csv(locationGamesFile)
+# Search of the most similar games: 'exact' (all pairs) or 'ann' (approximate, see ann_index.py)
+neighbor_search = os.environ.get('CONTENT_SEARCH', 'exact')
+top_k_games = text_ann_top_k if neighbor_search == 'ann' else text_top_k
 
-# Get users data from CSV
+# Games, users and reviews data (read in the main guard, not again by every worker process)
+locationGamesFile = pathlib.Path(r'../../data/intermediate_data/processed_games_for_content-based.csv')
 locationUsersFile = pathlib.Path(r'../../data/model_data/steam_user_train.csv')   # data/purchase_play
-dataUsers = read_csv(locationUsersFile)
-
-# get review info from csv
 locationReviewFile = pathlib.Path(r'../../data/intermediate_data/steam_games_reviews.csv')
-dataReviews = read_csv(locationReviewFile, usecols=["name", "percentage_positive_review"],)
-
-# Construct a reverse map of indices and game names
-indices = Series(dataGames.index, index=dataGames['name']).drop_duplicates()
-
-# get list of games we have info about
-listGames = dataGames['name'].unique()
 
 # create dataframe for recommendations
 col_names = list(map(str, range(1, n_recommendation + 1)))
 col_names = ["user_id"] + col_names
 
 
-# Function that takes in game name and Cosine Similarity matrix as input and outputs most similar games
-def get_recommendations(title, cosine_sim):
-
-    if title not in listGames:
-        return []
-
-    # Get the index of the game that matches the name
-    idx = indices[title]
-
-    # if there's 2 games or more with same name (game RUSH)
-    if type(idx) is Series:
-        return []
-
-    # Get the pairwise similarity scores of all games with that game
-    sim_scores = list(enumerate(cosine_sim[idx]))
-
-    # Sort the games based on the similarity scores
-    sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-
-    # Get the scores of the most similar games
-    # (not the first one because this games as a score of 1 (perfect score) similarity with itself)
-    sim_scores = sim_scores[1:n_recommendation + 1]
-
-    # Get the games indices
-    movie_indices = [i[0] for i in sim_scores]
-
-    # Return the top most similar games
-    return dataGames['name'].iloc[movie_indices].tolist()
-
-
-def make_recommendation_for_user(user_id, game_list, game_user_have):
-    if type(game_list) is not list or len(game_list) == 0:
-        # return empty one
-        return DataFrame(data=[[user_id] + [""] * n_recommendation], columns=col_names)
-
-    # get reviews of game recommendation, remove the games the user already has and order them by reviews
-    recommendation_reviews = dataReviews.loc[dataReviews['name'].isin(game_list)]
-    recommendation_reviews = recommendation_reviews.loc[~recommendation_reviews['name'].isin(game_user_have)]
-    recommendation_reviews = recommendation_reviews.sort_values(by="percentage_positive_review", ascending=False)
-
-    if len(recommendation_reviews.index) < n_recommendation:
-        return DataFrame(data=[[user_id] + recommendation_reviews["name"].tolist() +
-                               [""] * (n_recommendation - len(recommendation_reviews.index))],
-                         columns=col_names)
-    else:
-        return DataFrame(data=[[user_id] + recommendation_reviews["name"].tolist()[0:n_recommendation]],
-                         columns=col_names)
-
-
-def generate_recommendation_output(column_name, location_output_file):
-    recommendationByUserData = DataFrame(columns=col_names)
-
-    # need to do some modification on data to make sure there is no NaN in column
-    dataGames[column_name] = dataGames[column_name].fillna('')
-    # Compute the Cosine Similarity matrix using the column
-    count = CountVectorizer(stop_words='english')
-    count_matrix = count.fit_transform(dataGames[column_name])
-    cosine_sim_matrix = cosine_similarity(count_matrix, count_matrix)
-
-    previousId = ""
-    listSuggestion = list()
-    listGamesUserHas = list()
-
-    # loop on all row and get recommendations for user
-    for j, row in dataUsers.iterrows():
-        if previousId != row["user_id"]:
-            recommendationByUserData = concat([recommendationByUserData,
-                                               make_recommendation_for_user(previousId, listSuggestion, listGamesUserHas)],
-                                              ignore_index=True)
-            previousId = row["user_id"]
-            listSuggestion = list()
-            listGamesUserHas = list()
-        listGamesUserHas.extend([row["game_name"]])
-        listSuggestion.extend(get_recommendations(row["game_name"], cosine_sim_matrix))
-
-    # add the last element for the last user
-    recommendationByUserData = concat([recommendationByUserData,
-                                       make_recommendation_for_user(previousId, listSuggestion, listGamesUserHas)],
-                                      ignore_index=True)
-
-    recommendationByUserData.to_csv(location_output_file, index=False)
-
-
-generate_recommendation_output('popular_tags',
-                               pathlib.Path(r'../../data/output_data/content_based_recommender_output_popular_tags.csv'))
-generate_recommendation_output('genre',
-                               pathlib.Path(r'../../data/output_data/content_based_recommender_output_genre.csv'))
-generate_recommendation_output('genre_publisher_developer',
-                               pathlib.Path(r'../../data/output_data/content_based_recommender_output_genre_publisher_developer.csv'))
-generate_recommendation_output('genre_popular_tags_developer',
-                               pathlib.Path(r'../../data/output_data/content_based_recommender_output_genre_popular_tags_developer.csv'))
-generate_recommendation_output('genre_popular_tags_game_details',
-                               pathlib.Path(r'../../data/output_data/content_based_recommender_output_genre_popular_tags_game_details.csv'))
-generate_recommendation_output('genre_publisher_developer_game_details',
-                               pathlib.Path(r'../../data/output_data/content_based_recommender_output_genre_publisher_developer_game_details.csv'))
+def group_users():
+    # user grouping shared by all the feature columns: position of each user, game row
+    # of the games users have (games without info or sharing their name with another
+    # game have none), games owned by each user and reviews in their original order
+    userPosition, userIds = factorize(dataUsers["user_id"])
+    gameRows = dataUsers["game_name"].map(uniqueIndices)
+    hasInfo = gameRows.notna().values
+
+    return {"userIds": userIds,
+            "userWithInfo": userPosition[hasInfo],
+            "gameRows": gameRows[hasInfo].astype(int).values,
+            "owned": DataFrame({"user": userPosition, "name": dataUsers["game_name"].values}).drop_duplicates(),
+            "reviews": dataReviews.rename_axis("review").reset_index()}
+
+
+def make_recommendations(neighbor_ids, userGroups=None):
+    if userGroups is None:
+        userGroups = group_users()
+    userIds = userGroups["userIds"]
+
+    # explode the games of every user into their most similar games (candidates)
+    candidateRows = neighbor_ids[userGroups["gameRows"]]
+    candidates = DataFrame({"user": np.repeat(userGroups["userWithInfo"], candidateRows.shape[1]),
+                            "name": dataGames['name'].values[candidateRows.ravel()]}).drop_duplicates()
+
+    # remove the games the user already has
+    candidates = candidates.merge(userGroups["owned"], on=["user", "name"], how="left", indicator=True)
+    candidates = candidates.loc[candidates["_merge"] == "left_only", ["user", "name"]]
+
+    # get reviews of game recommendation and order them by reviews for each user
+    ranked = candidates.merge(userGroups["reviews"], on="name")
+    ranked = ranked.sort_values(by=["user", "percentage_positive_review", "review"],
+                                ascending=[True, False, True], kind="mergesort")
+    ranked["rank"] = ranked.groupby("user").cumcount()
+    ranked = ranked.loc[ranked["rank"] < n_recommendation]
+
+    # one row per user with the recommendations in columns, empty when there are not enough
+    recommendationByUserData = ranked.pivot(index="user", columns="rank", values="name")
+    recommendationByUserData = recommendationByUserData.reindex(index=range(len(userIds)),
+                                                                columns=range(n_recommendation))
+    recommendationByUserData = recommendationByUserData.fillna("")
+    recommendationByUserData.columns = col_names[1:]
+    recommendationByUserData.insert(0, "user_id", userIds)
+
+    return recommendationByUserData.reset_index(drop=True)
+
+
+def generate_all_recommendation_outputs(output_files, processes=None):
+    # output_files maps each feature column to its output file. The similar games of every
+    # column are computed in parallel in a pool of processes, then the user grouping is
+    # done once and reused to rank the recommendations of each column
+    columns = list(output_files)
+    texts = [dataGames[column_name].fillna('').tolist() for column_name in columns]
+
+    neighbors = process_map(top_k_games, texts, [n_recommendation] * len(columns), processes=processes)
+
+    userGroups = group_users()
+    for column_name, (neighbor_ids, _) in zip(columns, neighbors):
+        recommendationByUserData = make_recommendations(neighbor_ids, userGroups)
+        recommendationByUserData.to_csv(output_files[column_name], index=False)
+
+
+if __name__ == "__main__":
+    # Get games data from CSV
+    dataGames = read_table(locationGamesFile)
+
+    # Get users data from CSV
+    dataUsers = read_table(locationUsersFile)
+
+    # get review info from csv
+    dataReviews = read_table(locationReviewFile, usecols=["name", "percentage_positive_review"],)
+
+    # Construct a reverse map of indices and game names
+    indices = Series(dataGames.index, index=dataGames['name']).drop_duplicates()
+
+    # same map restricted to names used by a single game (game RUSH has 2 or more)
+    uniqueIndices = indices[~indices.index.duplicated(keep=False)]
+
+    locationOutput = r'../../data/output_data/content_based_recommender_output_{}.csv'
+    generate_all_recommendation_outputs({column_name: pathlib.Path(locationOutput.format(column_name))
+                                         for column_name in ['popular_tags',
+                                                             'genre',
+                                                             'genre_publisher_developer',
+                                                             'genre_popular_tags_developer',
+                                                             'genre_popular_tags_game_details',
+                                                             'genre_publisher_developer_game_details']})
@@ -1,124 +1,95 @@
-import requests
+import os
 from bs4 import BeautifulSoup
+from table_io import write_table
+from wiki_scraper import WikiFetcher, extract_plots
+
+
+if __name__ == "__main__":
+    # Pages are fetched concurrently and cached on disk, a rerun only fetches the missing pages.
+    # WIKI_URL can point at a stand-in server and WIKI_FIXTURES at a directory of saved pages.
+    fetcher = WikiFetcher(base_url=os.environ.get('WIKI_URL', 'https://en.wikipedia.org'),
+                          cache_dir=os.environ.get('WIKI_CACHE', 'wiki_cache'),
+                          workers=int(os.environ.get('WIKI_WORKERS', 8)),
+                          rate=float(os.environ.get('WIKI_RATE', 5)),
+                          fixture_dir=os.environ.get('WIKI_FIXTURES'))
+
+    elements = []
+    #a access the web
+    list_link = '/wiki/List_of_Nintendo_Switch_games_(Q%E2%80%93Z)'
+    website_url = fetcher.fetch(list_link)
+    # Nothing can be scraped without the list of games (request failed, or no such fixture)
+    if website_url is None:
+        raise RuntimeError('Could not fetch the list of games {}{}'.format(fetcher.base_url, list_link))
 
-elements = []
-#a access the web
-website_url = requests.get('https://en.wikipedia.org/wiki/List_of_Nintendo_Switch_games_(Q%E2%80%93Z)').text
+    soup = BeautifulSoup(website_url,'lxml')
+    #print(soup.prettify())
 
-soup = BeautifulSoup(website_url,'lxml')
-#print(soup.prettify())
+    # find table
+    table = soup.find('table', class_='wikitable plainrowheaders sortable')
 
-# find table
-table = soup.find('table', class_='wikitable plainrowheaders sortable')
 
+    for row in table.find_all('tr'):
+        # tqdm._instances.clear()
 
-for row in table.find_all('tr'):
-    # tqdm._instances.clear()
+        # only find game names with links to their own pages
+        try:
+            game = row.find_all('th')
+            game_name = game[0].find(text=True)
+            game_link = game[0].find(href=True)['href']
+        except: pass 
+        # find rest of cells
+        else:
+            cells = row.find_all('td')
+            atts = []
+            for i in range(len(cells)-1):
+                att = cells[i].find(text=True)
+                atts.append(att)
 
-    # only find game names with links to their own pages
-    try:
-        game = row.find_all('th')
-        game_name = game[0].find(text=True)
-        game_link = game[0].find(href=True)['href']
-    except: pass 
-    # find rest of cells
-    else:
-        cells = row.find_all('td')
-        atts = []
-        for i in range(len(cells)-1):
-            att = cells[i].find(text=True)
-            atts.append(att)
-        
-        # append full row to list    
-        elements.append([game_name, game_link] + atts)
+            # append full row to list    
+            elements.append([game_name, game_link] + atts)
 
-print(elements)
+    print(elements)
 
-#====================================================================================================================================
+    #====================================================================================================================================
 
-import pandas as pd
+    import pandas as pd
 
-cols = ['Title', 'Link', 'Developer', 'Publisher', 'Release_JP']
+    cols = ['Title', 'Link', 'Developer', 'Publisher', 'Release_JP']
 
-df_games = pd.DataFrame(elements, columns=cols)
-df_games = df_games.astype(str)
+    df_games = pd.DataFrame(elements, columns=cols)
+    df_games = df_games.astype(str)
 
-# clean links 
-df_games = df_games.applymap(lambda x: x.replace('\n', ''))
-df_games = df_games.applymap(lambda x: x.replace(':', ''))
+    # clean links 
+    df_games = df_games.applymap(lambda x: x.replace('\n', ''))
+    df_games = df_games.applymap(lambda x: x.replace(':', ''))
 
 
-print('Shape of dataframe: ', df_games.shape, '\n')
-df_games.head() 
+    print('Shape of dataframe: ', df_games.shape, '\n')
+    df_games.head() 
 
-# ====================================================================================================================================
-# Visit game own pages and extract plots
+    # ====================================================================================================================================
+    # Visit game own pages and extract plots
 
-wiki_url = 'https://en.wikipedia.org'
+    pages = fetcher.fetch_all(df_games['Link'])
 
-plots = []
-for idx, row in df_games.iterrows():
-    
-    url = wiki_url + row['Link']
-    
-    website_url = requests.get(url).text
+    # Only the 'Game...'/'Plot...' sections are parsed (lxml XPath, or 'soup' for the full
+    # BeautifulSoup tree) and cleaned, in a process pool over the cached pages
+    plots_clean = extract_plots(pages, parser=os.environ.get('PLOT_PARSER', 'xpath'))
 
-    soup = BeautifulSoup(website_url,'lxml')
-    #print(soup.prettify())
+    df_games['Plots'] = plots_clean
+
+    df_games.head()   
+
+    # ====================================================================================================================================              
+    # Drop 'Untitled' games
+    idx_todrop = df_games[df_games.Title=='Untitled '].index.tolist()
+    df_games.drop(index=idx_todrop, inplace=True)
+
+    # Rename cols
+    rename = {'Release_JP': 'Released in: Japan', 'Release_NA': 'North America', 
+     'Release_Pal': 'Rest of countries'}
+    df_games.rename(columns=rename, inplace=True)        
+
+
+    write_table(df_games.dropna(), 'Games_dataset.csv', index=True)        
 
-    text = ''
-    
-    for section in soup.find_all('h2'):
-        
-        if section.text.startswith('Game') or section.text.startswith('Plot'):
-
-            text += section.text + '\n\n'
-
-            for element in section.next_siblings:
-                if element.name and element.name.startswith('h'):
-                    break
-
-                elif element.name == 'p':
-                    text += element.text + '\n'
-
-        else: pass
-    
-    if not text:
-        plots.append(None)
-    else:
-        plots.append(text)
-
-# ====================================================================================================================================        
-# Clean texts
-import re
-
-plots_clean = []
-for text in plots:
-    if text is not None:
-        text = re.sub(r'\[.*?\]+', '', text)
-        text = text.replace('\n', ' ')
-        text = text.replace('Gameplay ', '')
-        text = text.replace('Game-play ', '')
-        text = text.replace('Plot ', '')
-        plots_clean.append(text)
-    else:
-        plots_clean.append(None)
-
-df_games['Plots'] = plots_clean
-
-df_games.head()   
-     
-# ====================================================================================================================================              
-# Drop 'Untitled' games
-idx_todrop = df_games[df_games.Title=='Untitled '].index.tolist()
-df_games.drop(index=idx_todrop, inplace=True)
-
-# Rename cols
-rename = {'Release_JP': 'Released in: Japan', 'Release_NA': 'North America', 
- 'Release_Pal': 'Rest of countries'}
-df_games.rename(columns=rename, inplace=True)        
-        
-        
-df_games.dropna().to_csv('Games_dataset.csv')        
-        
-        
\ No newline at end of file
@@ -0,0 +1,133 @@
+import pathlib
+import numpy as np
+import pandas as pd
+from game_names import normalize_game_names
+from table_io import read_table
+
+# Values used by the recommenders to fill a slot without recommendation.
+PLACEHOLDERS = ('', '0', '-999', 'nan')
+
+
+def rmse(predicted, actual):
+    """
+    Function to compute the Root Mean Squared Error between predicted and
+    actual values (with the n - 1 correction used in EM_Rating).
+    """
+
+    errors = np.asarray(predicted, dtype=float) - np.asarray(actual, dtype=float)
+
+    return np.sqrt(np.sum(errors ** 2) / (len(errors) - 1))
+
+
+def ranking_metrics(df_recommendation, df_truth, k=20, catalog=None, key=None):
+    """
+    Function to compute top-N ranking metrics in batch for all users.
+    'df_recommendation' follows the layout of the recommender outputs:
+      [user_id] [1] [2] [3] [4] .... [n]
+    'df_truth' holds the relevant (user, item) pairs in its first two
+    columns, e.g. the test dataset. 'key', if given, is applied to the item
+    names of both sides (pandas Series -> Series) so that differently
+    formatted names can be matched. 'catalog' is the number of items used
+    for the coverage; by default the items seen on either side.
+    Only users with at least one relevant item are evaluated.
+    Returns a dictionary with precision@k, recall@k, map@k, ndcg@k, coverage
+    and the number of evaluated users.
+    """
+
+    # Recommended items as an array [users, k], placeholders marked invalid.
+    df_recommendation = df_recommendation.drop_duplicates(df_recommendation.columns[0])
+    rec_users = df_recommendation.iloc[:, 0].astype(str).values
+    rec_items = df_recommendation.iloc[:, 1:k + 1].astype(str)
+    if key is not None:
+        rec_items = rec_items.apply(key)
+    rec_items = rec_items.values
+    valid = ~np.isin(rec_items, PLACEHOLDERS)
+    k = rec_items.shape[1]
+
+    truth_users = df_truth.iloc[:, 0].astype(str)
+    truth_items = df_truth.iloc[:, 1].astype(str)
+    if key is not None:
+        truth_items = key(truth_items)
+
+    # Shared integer codes for users and items.
+    user_codes, user_names = pd.factorize(np.concatenate([truth_users.values, rec_users]))
+    item_codes, item_names = pd.factorize(np.concatenate([truth_items.values, rec_items[valid]]))
+    n_truth, n_items = len(truth_users), len(item_names)
+    truth_user_codes, rec_user_codes = user_codes[:n_truth], user_codes[n_truth:]
+
+    # Relevant pairs as single integer keys.
+    truth_keys = np.unique(truth_user_codes.astype(np.int64) * n_items + item_codes[:n_truth])
+    relevant = np.bincount(truth_keys // n_items, minlength=len(user_names))[rec_user_codes]
+
+    rec_item_codes = np.full(rec_items.shape, -1, dtype=np.int64)
+    rec_item_codes[valid] = item_codes[n_truth:]
+    rec_keys = rec_user_codes[:, None].astype(np.int64) * n_items + rec_item_codes
+
+    # An item recommended several times to a user is only a hit at its first rank.
+    order = np.argsort(rec_item_codes, axis=1, kind='stable')
+    sorted_codes = np.take_along_axis(rec_item_codes, order, axis=1)
+    repeated = np.zeros(rec_item_codes.shape, dtype=bool)
+    np.put_along_axis(repeated, order[:, 1:], sorted_codes[:, 1:] == sorted_codes[:, :-1], axis=1)
+
+    hits = (np.isin(rec_keys, truth_keys) & valid & ~repeated).astype(float)
+
+    # Keep only users with relevant items.
+    evaluated = relevant > 0
+    hits, relevant = hits[evaluated], relevant[evaluated]
+    n_ideal = np.minimum(relevant, k)
+
+    cumulative_hits = np.cumsum(hits, axis=1)
+    ranks = np.arange(1, k + 1)
+    discounts = 1 / np.log2(ranks + 1)
+
+    precision = cumulative_hits[:, -1] / k
+    recall = cumulative_hits[:, -1] / relevant
+    average_precision = np.sum(hits * cumulative_hits / ranks, axis=1) / n_ideal
+    ndcg = (hits @ discounts) / np.cumsum(discounts)[n_ideal - 1]
+
+    if catalog is None:
+        catalog = n_items
+
+    return {'users': int(evaluated.sum()),
+            'precision@{}'.format(k): float(precision.mean()),
+            'recall@{}'.format(k): float(recall.mean()),
+            'map@{}'.format(k): float(average_precision.mean()),
+            'ndcg@{}'.format(k): float(ndcg.mean()),
+            'coverage': float(len(np.unique(rec_item_codes[valid])) / catalog)}
+
+
+def evaluate_outputs(output_files, test_file, k=20, keys=None, catalog=None):
+    """
+    Function to compare recommender outputs (csv files with 'n' recommended
+    items per user) against the same test dataset.
+    'output_files' maps a model name to its csv file, and 'keys' optionally
+    maps a model name to the 'key' used to match its item names.
+    Returns a dataframe with one row of metrics per model.
+    """
+
+    keys = keys or {}
+    df_truth = read_table(pathlib.Path(test_file))
+
+    results = {}
+    for name, output_file in output_files.items():
+        df_recommendation = pd.read_csv(pathlib.Path(output_file), dtype=str, keep_default_na=False)
+        results[name] = ranking_metrics(df_recommendation, df_truth, k, catalog, keys.get(name))
+
+    return pd.DataFrame.from_dict(results, orient='index')
+
+
+if __name__ == "__main__":
+    output_location = r'../../data/output_data/'
+    outputs = {'als': output_location + 'Collaborative_recommender_als_output.csv',
+               'em': output_location + 'Collaborative_EM_output.csv'}
+    for col in ['popular_tags', 'genre', 'genre_publisher_developer', 'genre_popular_tags_developer',
+                'genre_popular_tags_game_details', 'genre_publisher_developer_game_details']:
+        outputs['content_' + col] = output_location + 'content_based_recommender_output_{}.csv'.format(col)
+    outputs = {name: path for name, path in outputs.items() if pathlib.Path(path).exists()}
+
+    # The EM recommender outputs game names without special characters.
+    em_key = lambda names: normalize_game_names(names, lower=False)
+
+    df_metrics = evaluate_outputs(outputs, r'../../data/model_data/steam_user_test.csv',
+                                  keys={'em': em_key})
+    print(df_metrics)
@@ -0,0 +1,66 @@
+import json
+import pathlib
+import pandas as pd
+
+# Characters removed from the game names to build the join keys.
+SPECIAL_CHARACTERS = '[^A-Za-z0-9]+'
+
+
+def _load_keys(cache_path):
+    """
+    Function to read the name -> key map cached by '_save_keys' (empty if
+    there is no cache yet).
+    """
+
+    if cache_path is None or not pathlib.Path(cache_path).exists():
+        return {}
+
+    with open(cache_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_keys(cache_path, keys):
+    """
+    Function to write the name -> key map as a json file.
+    """
+
+    cache_path = pathlib.Path(cache_path)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        json.dump(keys, f, ensure_ascii=False)
+
+
+def normalize_game_names(names, cache_path=None, lower=True):
+    """
+    Function to build the key used to join the game datasets from the game
+    names: spaces and special characters removed and, if 'lower' is True,
+    lower case letters.
+    Each distinct name is normalized only once, with vectorized string
+    operations. If 'cache_path' is given, the name -> key map is read from
+    and saved to that json file, so only new names are computed (the cache
+    keeps the case, 'lower' is applied afterwards, so every model can share
+    it). Missing names give an empty key.
+    Returns a pandas Series aligned with 'names'.
+    """
+
+    names = pd.Series(names)
+    codes, uniques = pd.factorize(names)
+    uniques = pd.Series(uniques, dtype=object)
+
+    cached = _load_keys(cache_path)
+    keys = uniques.map(cached).astype(object)
+    new = keys.isna()
+    if new.any():
+        keys[new] = uniques[new].astype(str).str.replace(SPECIAL_CHARACTERS, '', regex=True)
+        if cache_path is not None:
+            cached.update(zip(uniques[new], keys[new]))
+            _save_keys(cache_path, cached)
+
+    if lower:
+        keys = keys.str.lower()
+
+    # Missing names (code -1) get an empty key.
+    keys = pd.concat([keys, pd.Series([''])], ignore_index=True)
+
+    return pd.Series(keys.values[codes], index=names.index, dtype=object)
@@ -6,10 +6,11 @@ from plotnine.data import *
 import seaborn as sns
 import matplotlib.pyplot as plt
 from matplotlib.cm import ScalarMappable
+from table_io import read_table
 from plotnine import *
 
 locationUsersFile=pathlib.Path(r'D:/Game-Recommendation-System/data/raw_data/steam_users_purchase_play.csv')
-steam_clean = pd.read_csv(locationUsersFile, header=1, names=['user', 'game', 'hrs', 'purchase', 'play'])
+steam_clean = read_table(locationUsersFile, header=1, names=['user', 'game', 'hrs', 'purchase', 'play'])
 print(steam_clean)
 game_total_hrs = steam_clean.groupby(by='game')['hrs'].sum()
 most_played_games = game_total_hrs.sort_values(ascending=False)[:20]
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import pathlib
+import numpy as np
+import scipy.sparse as sparse
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.preprocessing import normalize
+
+
+def content_hash(text):
+    """
+    Function to compute the hash used to detect changed documents.
+    """
+
+    return hashlib.sha1(str(text).encode('utf-8')).hexdigest()
+
+
+class IncrementalTfidf:
+    """
+    Class keeping a fitted TF-IDF model (vocabulary and IDF) together with the
+    vectors of the documents it was applied to, keyed by a unique id of each
+    document (e.g. its link, titles may repeat), so that a
+    changed catalogue only needs the new or changed documents to be
+    vectorized. The vocabulary and IDF stay those of the last full fit: terms
+    unknown to the vocabulary are ignored until the next full fit.
+
+    The model is stored as a directory with the following files:
+      vocabulary.json  term -> column
+      idf.npy          [n_terms] inverse document frequency
+      vectors.npz      [n_documents, n_terms] sparse l2-normalized TF-IDF rows
+      keys.json        unique key of each row
+      hashes.json      content hash of each row
+      tokenizer.json   name of the tokenizer of the documents (if given)
+    """
+
+    __vocabulary_file, __idf_file, __vectors_file = 'vocabulary.json', 'idf.npy', 'vectors.npz'
+    __keys_file, __hashes_file, __tokenizer_file = 'keys.json', 'hashes.json', 'tokenizer.json'
+
+    def __init__(self, analyzer, vocabulary, idf, vectors, keys, hashes, tokenizer=None):
+        """
+        Class initialization. 'analyzer' turns a document into its terms and
+        must be the one the vocabulary was fitted with (e.g. the
+        'build_analyzer()' of an identically configured TfidfVectorizer).
+        'tokenizer' names the tokenizer that produced the documents (e.g.
+        token streams), so a model is not updated with another tokenizer.
+        """
+
+        self.analyzer = analyzer
+        self.vocabulary = vocabulary
+        self.idf = np.asarray(idf)
+        self.vectors = sparse.csr_matrix(vectors)
+        self.keys = list(keys)
+        self.hashes = list(hashes)
+        self.tokenizer = tokenizer
+
+        self.__counter = CountVectorizer(analyzer=analyzer, vocabulary=vocabulary)
+
+    @classmethod
+    def from_fitted(cls, vectorizer, vectors, keys, texts, tokenizer=None):
+        """
+        Method to keep the state of a TfidfVectorizer fitted on 'texts'
+        (l2 norm, no sublinear tf) and the vectors it produced.
+        """
+
+        vocabulary = {term: int(column) for term, column in vectorizer.vocabulary_.items()}
+
+        return cls(vectorizer.build_analyzer(), vocabulary, vectorizer.idf_, vectors, keys,
+                   [content_hash(text) for text in texts], tokenizer)
+
+    @classmethod
+    def exists(cls, path):
+        """
+        Method to check whether a model directory was saved at 'path' (models
+        saved before the rows were keyed by a unique id are ignored).
+        """
+
+        path = pathlib.Path(path)
+
+        return (path / cls.__vectors_file).exists() and (path / cls.__keys_file).exists()
+
+    @classmethod
+    def load(cls, path, analyzer):
+        """
+        Method to load a model directory saved with 'save'.
+        """
+
+        path = pathlib.Path(path)
+
+        with open(path / cls.__vocabulary_file, encoding='utf-8') as f:
+            vocabulary = json.load(f)
+        with open(path / cls.__keys_file, encoding='utf-8') as f:
+            keys = json.load(f)
+        with open(path / cls.__hashes_file, encoding='utf-8') as f:
+            hashes = json.load(f)
+
+        tokenizer = None
+        if (path / cls.__tokenizer_file).exists():
+            with open(path / cls.__tokenizer_file, encoding='utf-8') as f:
+                tokenizer = json.load(f)
+
+        return cls(analyzer, vocabulary, np.load(path / cls.__idf_file),
+                   sparse.load_npz(path / cls.__vectors_file), keys, hashes, tokenizer)
+
+    def save(self, path):
+        """
+        Method to save the model as a directory of json and numpy files.
+        """
+
+        path = pathlib.Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+
+        with open(path / self.__vocabulary_file, 'w', encoding='utf-8') as f:
+            json.dump(self.vocabulary, f, ensure_ascii=False)
+        with open(path / self.__keys_file, 'w', encoding='utf-8') as f:
+            json.dump(self.keys, f, ensure_ascii=False)
+        with open(path / self.__hashes_file, 'w', encoding='utf-8') as f:
+            json.dump(self.hashes, f)
+        with open(path / self.__tokenizer_file, 'w', encoding='utf-8') as f:
+            json.dump(self.tokenizer, f)
+
+        np.save(path / self.__idf_file, self.idf)
+        sparse.save_npz(path / self.__vectors_file, self.vectors)
+
+    def transform(self, texts):
+        """
+        Method to vectorize documents with the stored vocabulary and IDF, as
+        the fitted TfidfVectorizer would.
+        """
+
+        counts = self.__counter.transform(texts).astype(float)
+
+        return normalize(counts.multiply(self.idf).tocsr(), norm='l2')
+
+    def changes(self, keys, texts):
+        """
+        Method to compare a catalogue with the stored one. Returns the keys
+        that are new or whose text changed, and the keys that were removed.
+        Keys must be unique.
+        """
+
+        keys = list(keys)
+        if len(set(keys)) != len(keys):
+            raise ValueError('Keys must be unique to update the vectors.')
+
+        stored = dict(zip(self.keys, self.hashes))
+        changed = [key for key, text in zip(keys, texts) if stored.get(key) != content_hash(text)]
+        removed = sorted(set(self.keys) - set(keys))
+
+        return changed, removed
+
+    def update(self, keys, texts, documents=None):
+        """
+        Method to bring the model to a new catalogue (rows in the order of
+        'keys'): only new or changed documents are vectorized, the other
+        rows are reused. Changes are detected on 'texts'; 'documents' are
+        what the analyzer takes (e.g. token streams), the texts by default.
+        Returns the keys that were new or changed.
+        """
+
+        keys, texts = list(keys), list(texts)
+        documents = texts if documents is None else list(documents)
+        changed, _ = self.changes(keys, texts)
+        changed_set = set(changed)
+
+        old_rows = {key: row for row, key in enumerate(self.keys)}
+        changed_rows = [row for row, key in enumerate(keys) if key in changed_set]
+        kept_rows = [row for row, key in enumerate(keys) if key not in changed_set]
+
+        # Assemble the new matrix: reused rows, then the new vectors, then reorder.
+        parts = [self.vectors[[old_rows[keys[row]] for row in kept_rows]]]
+        if changed_rows:
+            parts.append(self.transform([documents[row] for row in changed_rows]))
+        order = np.argsort(np.array(kept_rows + changed_rows, dtype=int), kind='stable')
+
+        self.vectors = sparse.vstack(parts).tocsr()[order]
+        self.keys = keys
+        self.hashes = [content_hash(text) for text in texts]
+
+        return changed
@@ -0,0 +1,29 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+def process_map(function, *iterables, processes=None, chunksize=1):
+    """
+    Function to apply 'function' to the items of 'iterables' in a pool of
+    'processes' processes, like the builtin map, and return the results as
+    a list. The pool forks the current process where fork is available;
+    elsewhere (e.g. Windows) the workers are spawned and import the calling
+    script again, so scripts must keep their work under a main guard.
+    'function' must be importable (defined at module level). When no pool
+    can be started, the items are processed serially and a message says so.
+    """
+
+    iterables = [list(iterable) for iterable in iterables]
+    if processes == 1:
+        return list(map(function, *iterables))
+
+    method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+    try:
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context(method)) as executor:
+            return list(executor.map(function, *iterables, chunksize=chunksize))
+    except (BrokenProcessPool, NotImplementedError, OSError) as error:
+        print('Process pool unavailable ({}: {}), running {} serially.'.format(
+            type(error).__name__, error, function.__name__))
+
+    return list(map(function, *iterables))
@@ -0,0 +1,65 @@
+import numpy as np
+import scipy.sparse as sparse
+from scipy.cluster.hierarchy import linkage
+from scipy.spatial.distance import squareform
+from sklearn.cluster import AgglomerativeClustering, MiniBatchKMeans
+from sklearn.preprocessing import normalize
+from ann_index import embed
+
+
+def minibatch_clusters(vectors, n_clusters=7, batch_size=1024, seed=None):
+    """
+    Function to cluster (sparse) feature vectors, L2 normalized, with a
+    mini-batch KMeans: each step only reads 'batch_size' rows, so it scales
+    with the number of games without a dense copy of the vectors.
+    Returns the cluster label of each row.
+    """
+
+    km = MiniBatchKMeans(n_clusters=n_clusters, batch_size=batch_size, n_init=3, random_state=seed)
+
+    return km.fit_predict(normalize(vectors, norm='l2', axis=1))
+
+
+def neighbor_graph(ids):
+    """
+    Function to build the sparse connectivity graph [n, n] of a top-K
+    neighbor index ('ids' of 'top_k_cosine' or a NeighborIndex): an edge
+    between each row and each of its neighbors (-1 ignored).
+    """
+
+    n_rows = ids.shape[0]
+    valid = ids >= 0
+    rows = np.repeat(np.arange(n_rows), ids.shape[1])[valid.ravel()]
+
+    return sparse.csr_matrix((np.ones(len(rows)), (rows, ids[valid])), shape=(n_rows, n_rows))
+
+
+def neighbor_graph_clusters(vectors, ids, n_clusters=7, method='ward', n_components=128):
+    """
+    Function to cluster games hierarchically on a reduced embedding of their
+    feature vectors (truncated SVD, L2 normalized, see 'ann_index.embed'),
+    where clusters can only be merged along the edges of the top-K neighbor
+    graph. Only the distances of the N x K edges are computed, never the
+    N x N matrix. 'method' is 'ward' (euclidean distance, which on unit
+    vectors orders pairs as the cosine distance) or 'average', 'complete'
+    or 'single' (cosine distance). Returns the cluster label of each row.
+    """
+
+    metric = 'euclidean' if method == 'ward' else 'cosine'
+    model = AgglomerativeClustering(n_clusters=n_clusters, metric=metric, linkage=method,
+                                    connectivity=neighbor_graph(ids))
+
+    return model.fit_predict(embed(vectors, n_components))
+
+
+def full_linkage(similarity, method='complete'):
+    """
+    Function to compute the hierarchical clustering of all the games from
+    their dense cosine similarity matrix. linkage expects the condensed
+    distance vector (upper triangle), not the square matrix.
+    """
+
+    distance = np.clip(1 - np.asarray(similarity, dtype=np.float64), 0, None)
+    np.fill_diagonal(distance, 0)
+
+    return linkage(squareform(distance, checks=False), method=method)
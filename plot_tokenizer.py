@@ -0,0 +1,172 @@
+import json
+import os
+import pathlib
+import re
+from functools import lru_cache
+import nltk
+from nltk.stem.snowball import SnowballStemmer
+from nltk.tokenize import NLTKWordTokenizer
+from incremental_tfidf import content_hash
+from parallel import process_map
+
+
+def punkt_available():
+    """
+    Function to check whether nltk.sent_tokenize can run with the punkt
+    resource installed locally (it is never downloaded at run time). The
+    resource it loads depends on the nltk version (punkt_tab since 3.8.2),
+    so the sentence tokenizer itself is tried.
+    """
+
+    try:
+        nltk.sent_tokenize('a. b')
+    except LookupError:
+        return False
+
+    return True
+
+
+# Sentence splitter: 'nltk' (punkt, must be installed beforehand, e.g. python -m nltk.downloader punkt_tab),
+# 'regex' (no resource needed) or 'auto' (punkt when installed, regex otherwise).
+TOKENIZER = os.environ.get('PLOT_TOKENIZER', 'auto')
+if TOKENIZER == 'auto':
+    TOKENIZER = 'nltk' if punkt_available() else 'regex'
+if TOKENIZER not in ('nltk', 'regex'):
+    raise ValueError('Unknown tokenizer: {}'.format(TOKENIZER))
+
+# Name of the tokenizer, stored with the token streams so streams of another tokenizer are not reused.
+TOKENIZER_NAME = 'nltk-punkt-snowball' if TOKENIZER == 'nltk' else 'regex-treebank-snowball'
+
+# Words followed by a period that do not end a sentence in the regex splitter.
+ABBREVIATIONS = {'mr', 'mrs', 'ms', 'dr', 'prof', 'sr', 'jr', 'st', 'mt', 'vs', 'etc', 'e.g', 'i.e',
+                 'no', 'vol', 'inc', 'ltd', 'co', 'corp', 'bros', 'jan', 'feb', 'mar', 'apr', 'jun',
+                 'jul', 'aug', 'sep', 'sept', 'oct', 'nov', 'dec'}
+SENTENCE_END = re.compile(r'([.!?]+)["\')\]]*\s+(?=(\S))')
+WORD_BEFORE = re.compile(r'(\S*?)[.!?]+["\')\]]*$')
+
+# Word tokenizer used by nltk.word_tokenize, pure regular expressions.
+word_tokenizer = NLTKWordTokenizer()
+
+# Number of distinct words whose stem is kept in memory.
+STEM_CACHE_SIZE = 2 ** 16
+
+# Create an English language SnowballStemmer object
+stemmer = SnowballStemmer("english")
+
+
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def stem(word):
+    """
+    Function to stem a word, memoized as the vocabulary of the plots is
+    heavily repeated.
+    """
+
+    return stemmer.stem(word)
+
+
+def regex_sentences(text):
+    """
+    Function to split a text into sentences without any nltk resource: a
+    sentence ends with . ! or ? (and closing quotes or brackets) followed by
+    a space, except after a common abbreviation, a single letter initial or
+    a dotted acronym (e.g. 'u.s.'), and except an ellipsis followed by a
+    lower case letter. Works on lower cased text.
+    """
+
+    sentences, start = [], 0
+
+    for end in SENTENCE_END.finditer(text):
+        word = WORD_BEFORE.search(text[start:end.end()].rstrip())
+        word = word.group(1).lower().lstrip('("\'') if word else ''
+        if end.group(1) == '.' and (word in ABBREVIATIONS or len(word) == 1 or '.' in word):
+            continue
+        if end.group(1).startswith('..') and end.group(2).islower():
+            continue
+        sentences.append(text[start:end.end()].strip())
+        start = end.end()
+
+    sentences.append(text[start:].strip())
+
+    return [sentence for sentence in sentences if sentence]
+
+
+def sentences(text):
+    """
+    Function to split a text into sentences with the configured splitter.
+    """
+
+    if TOKENIZER == 'nltk':
+        return nltk.sent_tokenize(text)
+
+    return regex_sentences(text)
+
+
+def tokenize_and_stem(text):
+    """
+    Function to perform both stemming and tokenization.
+    """
+
+    # Tokenize by sentence, then by word
+    tokens = [word for sent in sentences(text)
+              for word in word_tokenizer.tokenize(sent)]
+
+    # Filter out raw tokens to remove noise
+    filtered_tokens = [token for token in tokens if re.search('[a-zA-Z]', token)]
+
+    # Stem the filtered_tokens
+    return [stem(word) for word in filtered_tokens]
+
+
+def identity(tokens):
+    """
+    Function returning its input, used as tokenizer and preprocessor of the
+    vectorizers fed with token streams.
+    """
+
+    return tokens
+
+
+def tokenize_documents(texts, processes=None, chunksize=16):
+    """
+    Function to tokenize and stem documents (lower cased first, as the
+    vectorizers did) in a pool of 'processes' processes (see
+    'parallel.process_map'). Returns one list of tokens per document.
+    """
+
+    texts = [str(text).lower() for text in texts]
+
+    return process_map(tokenize_and_stem, texts, processes=processes, chunksize=chunksize)
+
+
+def tokenize_cached(texts, cache_path=None, processes=None):
+    """
+    Function to return the token streams of documents, reusing the streams
+    saved in the json file 'cache_path' (keyed by the content hash of each
+    document) and tokenizing only the new documents. When documents were
+    tokenized, the cache is rewritten with the streams of the given
+    documents. Refits and parameter sweeps on the same documents then skip
+    tokenization.
+    """
+
+    texts = list(texts)
+    hashes = [content_hash(text) for text in texts]
+
+    streams = {}
+    if cache_path is not None and pathlib.Path(cache_path).exists():
+        with open(cache_path, encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('tokenizer') == TOKENIZER_NAME:
+            streams = cached['streams']
+
+    missing = sorted({key: text for key, text in zip(hashes, texts) if key not in streams}.items())
+    if missing:
+        streams.update(zip([key for key, _ in missing],
+                           tokenize_documents([text for _, text in missing], processes)))
+
+    tokens = [streams[key] for key in hashes]
+
+    if cache_path is not None and missing:
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            json.dump({'tokenizer': TOKENIZER_NAME, 'streams': dict(zip(hashes, tokens))}, f)
+
+    return tokens
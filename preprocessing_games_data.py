@@ -1,6 +1,7 @@
-import re
 from pandas import read_csv
 import pathlib
+from game_names import normalize_game_names
+from table_io import read_table, write_table
 
 # Get games data from CSV
 locationGamesFile = pathlib.Path(r'../../data/raw_data/steam_games.csv')
@@ -8,25 +9,16 @@ dataGames = read_csv(locationGamesFile,
                      usecols=["name", "genre", "game_details", "popular_tags", "publisher", "developer"])
 
 locationUsersFile = pathlib.Path(r'../../data/raw_data/steam_users_purchase_play.csv')
-dataUsers = read_csv(locationUsersFile, header=None, usecols=[0, 1, 2, 3],
+dataUsers = read_table(locationUsersFile, header=None, usecols=[0, 1, 2, 3],
                      names=["user_id", "game_name", "behavior", "hours"])
 
 dataGames['name'] = dataGames['name'].fillna('')
 
-# create column ID for game and user dataset
-dataGames["ID"] = ""
-dataUsers["ID"] = ""
-
-# remove spaces and special character from game name in both dataset
-for i, row in dataGames.iterrows():
-    clean = re.sub('[^A-Za-z0-9]+', '', row["name"])
-    clean = clean.lower()
-    dataGames.at[i, 'ID'] = clean
-
-for i, row in dataUsers.iterrows():
-    clean = re.sub('[^A-Za-z0-9]+', '', row["game_name"])
-    clean = clean.lower()
-    dataUsers.at[i, 'ID'] = clean
+# create column ID for game and user dataset: remove spaces and special character
+# from game name in both dataset (name -> ID map cached on disk)
+locationNamesCache = pathlib.Path(r'../../data/intermediate_data/game_name_keys.json')
+dataGames["ID"] = normalize_game_names(dataGames["name"], locationNamesCache)
+dataUsers["ID"] = normalize_game_names(dataUsers["game_name"], locationNamesCache)
 
 # find all the games in the game dataset that match the games in user dataset
 gameArrayUsers = dataUsers["ID"].unique()
@@ -65,5 +57,5 @@ usedGames["genre_popular_tags_game_details"] = usedGames['genre'] + usedGames['p
 usedGames["genre_publisher_developer_game_details"] = usedGames['genre'] + usedGames['publisher'] + usedGames['developer'] + usedGames['game_details']
 
 usedGames.drop_duplicates("name")
-usedGames.to_csv(pathlib.Path(r'../../data/intermediate_data/processed_games_for_content-based.csv'), index=False)
+write_table(usedGames, pathlib.Path(r'../../data/intermediate_data/processed_games_for_content-based.csv'))
 
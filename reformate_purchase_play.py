@@ -1,26 +1,100 @@
 import pandas as pd
 import numpy as np
 import pathlib
+from table_io import write_table
 from plotnine import *
 from plotnine.data import *
 import seaborn as sns
 import matplotlib.pyplot as plt
 
-locationUsersFile=pathlib.Path(r'D:/Game-Recommendation-System/data/raw_data/steam_users.csv')
-steam = pd.read_csv(locationUsersFile, header=None, names=['user', 'game', 'purchase_play', 'hrs', 'tmp'])
-steam.drop('tmp', inplace=True, axis=1)
-steam_clean = steam
+# Raw behaviour log columns: user, game, purchase/play, hrs (and an unused column)
+columns = ['user', 'game', 'purchase_play', 'hrs']
+# Compact dtypes used by the chunked mode
+chunk_dtypes = {'user': np.int32, 'game': 'category', 'purchase_play': 'category', 'hrs': np.float32}
+
+
+def purchase_play_flags(steam):
+    """
+    Function to derive the 'purchase' and 'play' flags of the raw behaviour
+    rows; the 1 written as 'hrs' on purchase rows is removed.
+    """
+
+    steam['purchase'] = (steam['purchase_play'] == 'purchase').astype(int)
+    steam['play'] = (steam['purchase_play'] == 'play').astype(int)
+    steam['hrs'] = steam['hrs'] - steam['purchase']
+
+    return steam
+
+
+def reformate_purchase_play(file):
+    """
+    Function to read the whole raw behaviour log and aggregate it into one row
+    per (user, game) with the total hrs, purchase and play.
+    """
+
+    steam = pd.read_csv(file, header=None, usecols=[0, 1, 2, 3], names=columns)
+    steam = purchase_play_flags(steam)
+
+    return steam.groupby(by=['user', 'game']).agg({'hrs': 'sum', 'purchase': 'sum', 'play': 'sum'}).reset_index()
 
 
+def reformate_purchase_play_chunked(file, chunksize=1000000, merge_rows=4000000):
+    """
+    Function to aggregate the raw behaviour log like 'reformate_purchase_play'
+    while reading it by chunks of 'chunksize' rows with compact dtypes
+    (categorical game, int32 user, float32 hrs), so memory does not grow
+    with the size of the log. Each chunk is aggregated on its own, with the
+    games coded by integers shared by all chunks, and the partial results are
+    merged (aggregated again) as soon as they hold more than 'merge_rows'
+    rows. Rows are sorted by user and game as in the in-memory version.
+    """
 
-steam_clean['purchase'] = steam_clean['purchase_play'] == 'purchase'
-steam_clean['purchase'] = steam_clean['purchase'].astype(int)
-steam_clean['play'] = steam_clean['purchase_play'] == 'play'
-steam_clean['play'] = steam_clean['play'].astype(int)
-steam_clean['hrs'] = steam_clean['hrs'] - steam_clean['purchase']
-steam_clean = steam_clean.groupby(by=['user', 'game']).agg({'hrs': 'sum', 'purchase': 'sum', 'play': 'sum'}).reset_index()
+    game_codes = {}
+    partials, partial_rows = [], 0
 
-steam_clean.to_csv(r'D:/Game-Recommendation-System/data/raw_data/purchase_play.csv',index=None)
+    def merge(partials):
+        merged = pd.concat(partials, ignore_index=True)
+        return merged.groupby(['user', 'game'], sort=False).sum().reset_index()
+
+    for chunk in pd.read_csv(file, header=None, usecols=[0, 1, 2, 3], names=columns,
+                             dtype=chunk_dtypes, chunksize=chunksize):
+        chunk = purchase_play_flags(chunk)
+
+        # Same integer code for a game in every chunk
+        for game in chunk['game'].cat.categories:
+            game_codes.setdefault(game, len(game_codes))
+        codes = np.array([game_codes[game] for game in chunk['game'].cat.categories], dtype=np.int32)
+
+        partial = pd.DataFrame({'user': chunk['user'].values,
+                                'game': codes[chunk['game'].cat.codes.values],
+                                'hrs': chunk['hrs'].values.astype(np.float64),
+                                'purchase': chunk['purchase'].values.astype(np.int32),
+                                'play': chunk['play'].values.astype(np.int32)})
+        partials.append(merge([partial]))
+        partial_rows += len(partials[-1])
+
+        if partial_rows > merge_rows:
+            partials = [merge(partials)]
+            partial_rows = len(partials[0])
+
+    steam_clean = merge(partials) if partials else pd.DataFrame(columns=['user', 'game', 'hrs', 'purchase', 'play'])
+    steam_clean['game'] = np.array(list(game_codes), dtype=object)[steam_clean['game'].values.astype(int)]
+
+    return steam_clean.sort_values(['user', 'game'], kind='stable').reset_index(drop=True)
+
+
+locationUsersFile=pathlib.Path(r'D:/Game-Recommendation-System/data/raw_data/steam_users.csv')
+# Read the raw log by chunks of that many rows (None reads it at once)
+chunk_size = 1000000
+
+if chunk_size:
+    steam_clean = reformate_purchase_play_chunked(locationUsersFile, chunk_size)
+    # hrs are read as float32, only write their significant digits
+    write_table(steam_clean, r'D:/Game-Recommendation-System/data/raw_data/purchase_play.csv',
+                float_format='%.7g')
+else:
+    steam_clean = reformate_purchase_play(locationUsersFile)
+    write_table(steam_clean, r'D:/Game-Recommendation-System/data/raw_data/purchase_play.csv')
 '''
 locationUsersFile = pathlib.Path(r'data/steam-200k.csv')
 steam = pd.read_csv(locationUsersFile, header=None, usecols=[0, 1, 2, 3],
@@ -1,10 +1,10 @@
-from pandas import read_csv
 import pathlib
+from table_io import read_table
 import matplotlib.pyplot as plt
 
 # get review info from csv
 locationReviewFile = pathlib.Path(r'../../data/intermediate_data/steam_games_reviews.csv')
-dataReviews = read_csv(locationReviewFile, usecols=["name", "percentage_positive_review"],)
+dataReviews = read_table(locationReviewFile, usecols=["name", "percentage_positive_review"],)
 
 plt.hist(x=dataReviews["percentage_positive_review"], range=[0, 100], bins=100)
 
@@ -0,0 +1,477 @@
+import json
+import os
+import pathlib
+import shutil
+import sys
+import time
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.preprocessing import normalize
+
+
+def _top_k_rows(chunk, rows, k):
+    """
+    Function to select, for each row of a dense similarity 'chunk', the 'k'
+    columns with the highest similarity, excluding the column of the row
+    itself ('rows' gives the global row number of each line of the chunk).
+    Returns the columns and the scores, closest first (ties by column).
+    """
+
+    # Exclude each game from its own neighbors.
+    chunk[np.arange(len(rows)), rows] = -np.inf
+
+    # Select the K closest games, then sort only those K.
+    top = np.argpartition(-chunk, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(chunk, top, axis=1)
+    order = np.lexsort((top, -top_scores), axis=1)
+
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+def top_k_cosine(vectors, k=20, chunk_size=256):
+    """
+    Function to compute the 'k' most cosine-similar rows of every row of a
+    (sparse) feature matrix, such as the output of a CountVectorizer or
+    TfidfVectorizer. Rows are L2 normalized once and multiplied by chunks of
+    'chunk_size' rows, so the full N x N similarity matrix is never held in
+    memory. Returns two arrays [n_rows, k]: neighbor rows (int32) and cosine
+    similarity (float32), closest first.
+    """
+
+    vectors = normalize(vectors, norm='l2', axis=1).astype(np.float32)
+    vectors_t = vectors.T.tocsr() if hasattr(vectors, 'tocsr') else vectors.T
+    n_rows = vectors.shape[0]
+    k = min(k, n_rows - 1)
+
+    ids = np.empty((n_rows, k), dtype=np.int32)
+    scores = np.empty((n_rows, k), dtype=np.float32)
+
+    for start in range(0, n_rows, chunk_size):
+        stop = min(start + chunk_size, n_rows)
+        chunk = vectors[start:stop] @ vectors_t
+        chunk = chunk.toarray() if hasattr(chunk, 'toarray') else np.asarray(chunk)
+
+        ids[start:stop], scores[start:stop] = _top_k_rows(chunk, np.arange(start, stop), k)
+
+    return ids, scores
+
+
+def text_top_k(texts, k=20, chunk_size=256):
+    """
+    Function to compute the 'k' most similar texts of every text, with the
+    cosine similarity of their token counts (CountVectorizer, English stop
+    words removed). Identical texts are vectorized only once. Returns the
+    same arrays as 'top_k_cosine'.
+    """
+
+    unique_texts, inverse = np.unique(np.asarray(texts, dtype=str), return_inverse=True)
+    count_matrix = CountVectorizer(stop_words='english').fit_transform(unique_texts)
+
+    return top_k_cosine(count_matrix[inverse.ravel()], k, chunk_size)
+
+
+def _save_titles(path, titles):
+    """
+    Function to write the title of each row as a json sidecar file.
+    """
+
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(list(titles), f, ensure_ascii=False)
+
+
+def _load_titles(path):
+    """
+    Function to read a json sidecar file written by '_save_titles'.
+    """
+
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+# File of a store directory naming its current version (a subdirectory).
+VERSION_FILE = 'current.json'
+
+
+def _save_version(path, write, kept=2):
+    """
+    Function to write a new version of a store directory without touching
+    the files that running processes may have memory-mapped: 'write' fills
+    a new version subdirectory, then the version file is swapped in with
+    os.replace, so readers see either the previous or the new version,
+    never a partial one. Only the 'kept' last versions are left (older ones
+    still mapped by a process are removed at a later save where the system
+    refuses it).
+    """
+
+    path = pathlib.Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+    version = 'v{}-{}'.format(time.time_ns(), os.getpid())
+    write(path / version)
+
+    partial = path / (VERSION_FILE + '.part')
+    with open(partial, 'w', encoding='utf-8') as f:
+        json.dump({'version': version}, f)
+    os.replace(partial, path / VERSION_FILE)
+
+    versions = sorted(directory for directory in path.glob('v*-*') if directory.is_dir())
+    for directory in versions[:-kept]:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _current_version(path):
+    """
+    Function to return the name of the current version of a store directory
+    (None for a store written before versions were used).
+    """
+
+    version_file = pathlib.Path(path) / VERSION_FILE
+    if not version_file.exists():
+        return None
+
+    with open(version_file, encoding='utf-8') as f:
+        return json.load(f)['version']
+
+
+def _current_directory(path):
+    """
+    Function to return the directory holding the files of the current
+    version of a store directory.
+    """
+
+    version = _current_version(path)
+
+    return pathlib.Path(path) if version is None else pathlib.Path(path) / version
+
+
+class SimilarityStore:
+    """
+    Class giving read access to the full game similarity matrix stored as a
+    binary numpy file, which is memory-mapped so that every app process
+    shares the same pages instead of parsing and keeping its own copy.
+
+    The store is a directory holding one subdirectory per version, named in
+    'current.json', with the following files:
+      matrix.npy   [n_games, n_games] float32 (or float16) cosine similarity
+      titles.json  list of game titles, one per row/column
+      stamp.json   stamp of the catalogue the matrix was computed for (if given)
+    A build that changes the catalogue without recomputing the matrix leaves
+    the store in place: its stamp tells that it is stale.
+    """
+
+    __matrix_file, __titles_file, __stamp_file = 'matrix.npy', 'titles.json', 'stamp.json'
+
+    def __init__(self, matrix, titles):
+        """
+        Class initialization from the similarity matrix and the titles of the
+        games (row order).
+        """
+
+        self.matrix = matrix
+        self.titles = list(titles)
+        self.__rows = {title: row for row, title in enumerate(self.titles)}
+
+    @classmethod
+    def save(cls, path, similarity, titles, dtype=np.float32, stamp=None):
+        """
+        Method to write a dense similarity matrix (higher values mean closer
+        games) to a store directory, with the 'stamp' of its catalogue.
+        Returns the store opened from disk.
+        """
+
+        def write(directory):
+            directory.mkdir()
+            np.save(directory / cls.__matrix_file, np.asarray(similarity, dtype=dtype))
+            _save_titles(directory / cls.__titles_file, titles)
+            with open(directory / cls.__stamp_file, 'w', encoding='utf-8') as f:
+                json.dump(stamp, f)
+
+        _save_version(path, write)
+
+        return cls.load(path)
+
+    @classmethod
+    def from_csv(cls, csv_file, path, dtype=np.float32):
+        """
+        Method to convert a legacy 'sim_matrix.csv' export, which holds cosine
+        distances (1 - similarity) indexed by title, into a store directory.
+        """
+
+        df_distance = pd.read_csv(pathlib.Path(csv_file), index_col=0)
+
+        return cls.save(path, 1 - df_distance.values, df_distance.index, dtype)
+
+    @classmethod
+    def load(cls, path, stamp=None):
+        """
+        Method to open the current version of a store directory. The matrix
+        is memory-mapped read only, so nothing is copied until rows are
+        accessed. If 'stamp' is given, a store computed for another
+        catalogue raises a ValueError.
+        """
+
+        if stamp is not None and cls.stamp(path) != stamp:
+            raise ValueError('The similarity store {} is stale: it was built for another catalogue.'.format(path))
+
+        path = _current_directory(path)
+
+        matrix = np.load(path / cls.__matrix_file, mmap_mode='r')
+        titles = _load_titles(path / cls.__titles_file)
+
+        return cls(matrix, titles)
+
+    @classmethod
+    def stamp(cls, path):
+        """
+        Method to return the stamp of the catalogue of the current version of
+        a store directory (None if no stamp was saved).
+        """
+
+        stamp_file = _current_directory(path) / cls.__stamp_file
+        if not stamp_file.exists():
+            return None
+
+        with open(stamp_file, encoding='utf-8') as f:
+            return json.load(f)
+
+    def __contains__(self, title):
+        return title in self.__rows
+
+    def __len__(self):
+        return len(self.titles)
+
+    def row(self, title):
+        """
+        Method to retrieve the similarity of the given 'title' to every game,
+        as a float32 array in row order.
+        """
+
+        return np.asarray(self.matrix[self.__rows[title]], dtype=np.float32)
+
+    def neighbor_index(self, k=20, keys=None):
+        """
+        Method to build the top-K neighbor index from the stored matrix.
+        """
+
+        return NeighborIndex.from_similarity(self.matrix, self.titles, k, keys=keys)
+
+
+class NeighborIndex:
+    """
+    Class holding a precomputed top-K nearest neighbor index for the games
+    catalogue, so that the recommendation apps only read K entries per request
+    instead of sorting a full row of the similarity matrix.
+
+    The index is stored on disk as a directory holding one subdirectory per
+    version, named in 'current.json', with the following files:
+      ids.npy      [n_games, K] int32 rows of the neighbors, closest first
+      scores.npy   [n_games, K] float32 cosine similarity of each neighbor
+      titles.json  list of game titles, one per row
+      keys.json    list of unique game keys (e.g. wiki links), one per row
+    A game is never listed as its own neighbor. Games are looked up by key,
+    or by title (the first game with that title, titles need not be unique).
+    """
+
+    __ids_file, __scores_file, __titles_file, __keys_file = 'ids.npy', 'scores.npy', 'titles.json', 'keys.json'
+
+    def __init__(self, ids, scores, titles, keys=None):
+        """
+        Class initialization from the neighbor rows, their scores, the titles
+        of the games (row order) and their unique keys (the titles by
+        default).
+        """
+
+        self.ids = ids
+        self.scores = scores
+        self.titles = list(titles)
+        self.keys = self.titles if keys is None else list(keys)
+
+        self.__rows, self.__title_rows = {}, {}
+        for row, (key, title) in enumerate(zip(self.keys, self.titles)):
+            self.__rows.setdefault(key, row)
+            self.__title_rows.setdefault(title, row)
+
+    @classmethod
+    def from_similarity(cls, similarity, titles, k=20, chunk_size=1024, keys=None):
+        """
+        Method to build the index from a dense similarity matrix (higher
+        values mean closer games). Rows are processed by chunks so that only
+        'chunk_size' rows are copied at a time.
+        """
+
+        n_games = similarity.shape[0]
+        k = min(k, n_games - 1)
+
+        ids = np.empty((n_games, k), dtype=np.int32)
+        scores = np.empty((n_games, k), dtype=np.float32)
+
+        for start in range(0, n_games, chunk_size):
+            stop = min(start + chunk_size, n_games)
+            chunk = np.array(similarity[start:stop], dtype=np.float32)
+
+            ids[start:stop], scores[start:stop] = _top_k_rows(chunk, np.arange(start, stop), k)
+
+        return cls(ids, scores, titles, keys)
+
+    @classmethod
+    def from_vectors(cls, vectors, titles, k=20, chunk_size=256, keys=None):
+        """
+        Method to build the index directly from the (sparse) feature vectors
+        of the games, with cosine similarity, without a dense matrix.
+        """
+
+        ids, scores = top_k_cosine(vectors, k, chunk_size)
+
+        return cls(ids, scores, titles, keys)
+
+    @classmethod
+    def from_csv(cls, csv_file, k=20):
+        """
+        Method to build the index from a legacy 'sim_matrix.csv' export, which
+        holds cosine distances (1 - similarity) indexed by title.
+        """
+
+        df_distance = pd.read_csv(pathlib.Path(csv_file), index_col=0)
+
+        return cls.from_similarity(1 - df_distance.values, df_distance.index, k)
+
+    def updated(self, vectors, titles, changed, chunk_size=256, keys=None):
+        """
+        Method to build the index of a changed catalogue from this one, given
+        the (sparse) feature vectors of the new catalogue, its 'titles' and
+        unique 'keys' (row order, the titles by default) and the keys of the
+        games that are new or whose vector changed. Games are matched with
+        the previous catalogue by key, and vectors of the other games must be
+        unchanged. Only these rows are searched against the whole catalogue:
+          - new or changed games
+          - games that had a removed or changed game among their neighbors
+        The neighbors of every other game are its previous neighbors merged
+        with the new or changed games, which gives the same top-K.
+        """
+
+        titles = list(titles)
+        keys = titles if keys is None else list(keys)
+        n_games = len(keys)
+        k = min(self.ids.shape[1], n_games - 1)
+        new_rows = {key: row for row, key in enumerate(keys)}
+        changed = set(changed)
+
+        # Previous rows -> new rows (-1 if the game was removed or changed).
+        old_to_new = np.array([-1 if key in changed else new_rows.get(key, -1)
+                               for key in self.keys], dtype=np.int64)
+        affected = np.array(sorted(new_rows[key] for key in changed if key in new_rows),
+                            dtype=np.int64)
+
+        old_kept = np.flatnonzero(old_to_new >= 0)
+        old_ids = old_to_new[np.asarray(self.ids)[old_kept]]
+        stale = (old_ids < 0).any(axis=1) | (old_ids.shape[1] < k)
+
+        vectors = normalize(vectors, norm='l2', axis=1).astype(np.float32)
+        ids = np.empty((n_games, k), dtype=np.int32)
+        scores = np.empty((n_games, k), dtype=np.float32)
+
+        # Games whose previous neighbors are all still valid: merge with the changed games.
+        merged = old_to_new[old_kept[~stale]]
+        if len(merged):
+            candidate_ids = old_ids[~stale][:, :k]
+            candidate_scores = np.asarray(self.scores)[old_kept[~stale]][:, :k]
+            if len(affected):
+                affected_scores = vectors[merged] @ vectors[affected].T
+                affected_scores = affected_scores.toarray() if hasattr(affected_scores, 'toarray') else affected_scores
+                candidate_ids = np.hstack([candidate_ids, np.broadcast_to(affected, (len(merged), len(affected)))])
+                candidate_scores = np.hstack([candidate_scores, affected_scores])
+
+            top = np.argpartition(-candidate_scores, k - 1, axis=1)[:, :k]
+            top_ids = np.take_along_axis(candidate_ids, top, axis=1)
+            top_scores = np.take_along_axis(candidate_scores, top, axis=1)
+            order = np.lexsort((top_ids, -top_scores), axis=1)
+            ids[merged] = np.take_along_axis(top_ids, order, axis=1)
+            scores[merged] = np.take_along_axis(top_scores, order, axis=1)
+
+        # Changed games and games that lost a neighbor: search the whole catalogue.
+        searched = np.union1d(affected, old_to_new[old_kept[stale]])
+        searched = np.union1d(searched, np.setdiff1d(np.arange(n_games), np.union1d(merged, searched)))
+        vectors_t = vectors.T.tocsr() if hasattr(vectors, 'tocsr') else vectors.T
+        for start in range(0, len(searched), chunk_size):
+            rows = searched[start:start + chunk_size]
+            chunk = vectors[rows] @ vectors_t
+            chunk = chunk.toarray() if hasattr(chunk, 'toarray') else np.asarray(chunk)
+            ids[rows], scores[rows] = _top_k_rows(chunk, rows, k)
+
+        return NeighborIndex(ids, scores, titles, keys)
+
+    def save(self, path):
+        """
+        Method to save the index as a new version of a directory of numpy
+        arrays and titles. Processes reading the previous version keep it.
+        """
+
+        def write(directory):
+            directory.mkdir()
+            np.save(directory / self.__ids_file, np.asarray(self.ids, dtype=np.int32))
+            np.save(directory / self.__scores_file, np.asarray(self.scores, dtype=np.float32))
+            _save_titles(directory / self.__titles_file, self.titles)
+            _save_titles(directory / self.__keys_file, self.keys)
+
+        _save_version(path, write)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Method to load the current version of an index saved with 'save'.
+        Arrays are memory-mapped read only, so app processes on the same host
+        share them.
+        """
+
+        path = _current_directory(path)
+
+        ids = np.load(path / cls.__ids_file, mmap_mode='r')
+        scores = np.load(path / cls.__scores_file, mmap_mode='r')
+        titles = _load_titles(path / cls.__titles_file)
+        keys = _load_titles(path / cls.__keys_file) if (path / cls.__keys_file).exists() else None
+
+        return cls(ids, scores, titles, keys)
+
+    @staticmethod
+    def version(path):
+        """
+        Method to return the name of the current version of a saved index,
+        e.g. as a cache key so apps reload the index after a rebuild.
+        """
+
+        return _current_version(path)
+
+    def __contains__(self, game):
+        return game in self.__rows or game in self.__title_rows
+
+    def __len__(self):
+        return len(self.titles)
+
+    def neighbors(self, game, n=5, with_scores=False, keys=False):
+        """
+        Method to retrieve the 'n' games closest to the given 'game' (key, or
+        title), closest first, as titles (keys if 'keys' is True). If
+        'with_scores' is True, (title or key, score) pairs are returned.
+        """
+
+        row = self.__rows[game] if game in self.__rows else self.__title_rows[game]
+        ids = self.ids[row, :n]
+        names = self.keys if keys else self.titles
+        names = [names[i] for i in ids]
+
+        if with_scores:
+            return list(zip(names, self.scores[row, :n].tolist()))
+
+        return names
+
+
+if __name__ == "__main__":
+    # Convert a legacy similarity matrix export into a binary store and a
+    # top-K neighbor index:
+    #   python similarity_index.py sim_matrix.csv sim_store sim_index
+    csv_location = sys.argv[1] if len(sys.argv) > 1 else 'sim_matrix.csv'
+    store_location = sys.argv[2] if len(sys.argv) > 2 else 'sim_store'
+    index_location = sys.argv[3] if len(sys.argv) > 3 else 'sim_index'
+    store = SimilarityStore.from_csv(csv_location, store_location)
+    store.neighbor_index().save(index_location)
@@ -0,0 +1,182 @@
+import os
+import pathlib
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.feather
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Columnar formats that can be written next to the csv tables.
+COLUMNAR_FORMATS = ('parquet', 'feather')
+
+# Format of the columnar copy written by 'write_table' ('csv' writes the csv only).
+# Parquet by default when pyarrow is installed.
+TABLE_FORMAT = os.environ.get('TABLE_FORMAT', 'parquet' if pyarrow is not None else 'csv')
+
+
+def columnar_path(path, table_format):
+    """
+    Function to return the path of the columnar copy of a csv table: same
+    name, with the extension of the format.
+    """
+
+    return pathlib.Path(path).with_suffix('.' + table_format)
+
+
+def _columnar_copy(path):
+    """
+    Function to find an up to date columnar copy of a csv table (not older
+    than the csv file). Returns its path and format, or (None, None).
+    """
+
+    if pyarrow is None:
+        return None, None
+
+    for table_format in COLUMNAR_FORMATS:
+        copy = columnar_path(path, table_format)
+        if copy.exists() and (not path.exists() or copy.stat().st_mtime >= path.stat().st_mtime):
+            return copy, table_format
+
+    return None, None
+
+
+def _csv_rows(n_rows, header='infer', skiprows=None, names=None):
+    """
+    Function to find the rows of a columnar copy that 'pandas.read_csv' would
+    return from the csv file written by 'write_table' (line 0 the column
+    names, line i + 1 the row i), given its 'header' and 'skiprows'.
+    Returns the positions of the rows, or None when the result would depend
+    on the csv text (the column names line read as data, column names read
+    from a data line, callable 'skiprows' or a multi-line header).
+    """
+
+    if callable(skiprows) or isinstance(header, (list, tuple)):
+        return None
+
+    lines = list(range(n_rows + 1))
+    if skiprows is not None:
+        skipped = set(range(skiprows)) if isinstance(skiprows, int) else set(skiprows)
+        lines = [line for line in lines if line not in skipped]
+
+    if header == 'infer':
+        header = 0 if names is None else None
+    if header is not None:
+        if header >= len(lines) or (names is None and lines[header] != 0):
+            return None
+        lines = lines[header + 1:]
+
+    if 0 in lines:
+        return None
+
+    return [line - 1 for line in lines]
+
+
+def read_table(path, usecols=None, **csv_kwargs):
+    """
+    Function to read a table of the pipeline, given the path of its csv file.
+    If an up to date Parquet or Feather copy of the table exists (see
+    'write_table') it is read instead, loading only the 'usecols' columns and
+    keeping the stored dtypes; otherwise the csv file is parsed with
+    'pandas.read_csv(path, usecols=usecols, **csv_kwargs)'.
+    For the columnar copy, positional 'usecols', 'names' (renames the columns
+    in order), 'index_col', 'header' and 'skiprows' (rows dropped as from the
+    csv file) are applied as read_csv would; the other csv options only
+    concern the csv file. When 'header'/'skiprows' cannot be applied to the
+    copy (see '_csv_rows'), the csv file is read instead.
+    """
+
+    path = pathlib.Path(path)
+    if path.suffix[1:] in COLUMNAR_FORMATS:
+        copy, table_format = path, path.suffix[1:]
+    else:
+        copy, table_format = _columnar_copy(path)
+
+    names = csv_kwargs.get('names')
+    header, skiprows = csv_kwargs.get('header', 'infer'), csv_kwargs.get('skiprows')
+    rows = None
+
+    if copy is not None and (header not in ('infer', 0) or skiprows is not None or names is not None):
+        n_rows = pyarrow.parquet.ParquetFile(copy).metadata.num_rows if table_format == 'parquet' \
+            else pyarrow.feather.read_table(copy, columns=[]).num_rows
+        rows = _csv_rows(n_rows, header, skiprows, names)
+        if rows is None:
+            if copy == path:
+                raise ValueError('header={!r}, skiprows={!r} cannot be applied to {}'.format(
+                    header, skiprows, path.name))
+            copy = None
+
+    if copy is None:
+        return pd.read_csv(path, usecols=usecols, **csv_kwargs)
+
+    index_col = csv_kwargs.get('index_col')
+    by_name = usecols is not None and names is None and all(isinstance(col, str) for col in usecols)
+    columns = list(usecols) if by_name else None
+
+    if table_format == 'parquet':
+        df_table = pd.read_parquet(copy, columns=columns)
+    else:
+        df_table = pd.read_feather(copy, columns=columns)
+
+    if not isinstance(df_table.index, pd.RangeIndex):
+        # Index stored by a parquet copy: first column, as in the csv file.
+        df_table = df_table.rename_axis(df_table.index.name or 'Unnamed: 0').reset_index(drop=by_name)
+    if rows is not None:
+        df_table = df_table.iloc[rows].reset_index(drop=True)
+    if usecols is not None and not by_name:
+        df_table = df_table.iloc[:, list(usecols)]
+    if names is not None:
+        df_table.columns = list(names)[:df_table.shape[1]]
+    elif header is None:
+        df_table.columns = range(df_table.shape[1])
+    if index_col is not None:
+        df_table = df_table.set_index(df_table.columns[index_col])
+        if df_table.index.name in ('index', 'Unnamed: 0'):
+            # Unnamed index stored by the columnar copy.
+            df_table.index.name = None
+
+    return df_table
+
+
+def write_table(df, path, index=False, table_format=None, columns=None, **csv_kwargs):
+    """
+    Function to write a table of the pipeline: the csv file at 'path'
+    ('pandas.to_csv' options in 'csv_kwargs') and, unless 'table_format' (by
+    default TABLE_FORMAT) is 'csv', a typed columnar copy next to it
+    ('parquet' or 'feather', same name) that 'read_table' reads first.
+    If the columnar copy cannot be written (pyarrow missing, columns of
+    mixed types), only the csv file is kept and any older copy is removed.
+    """
+
+    path = pathlib.Path(path)
+    table_format = table_format or TABLE_FORMAT
+    if csv_kwargs.get('header', True) is not True:
+        # The columnar copies stand for a csv file with its column names line
+        table_format = 'csv'
+    if columns is not None:
+        df = df[columns]
+
+    df.to_csv(path, index=index, **csv_kwargs)
+
+    for stale_format in COLUMNAR_FORMATS:
+        columnar_path(path, stale_format).unlink(missing_ok=True)
+    if table_format == 'csv':
+        return
+    if table_format not in COLUMNAR_FORMATS:
+        raise ValueError('Unknown table format: {}'.format(table_format))
+    if pyarrow is None:
+        print('pyarrow is not installed, {} written as csv only'.format(path.name))
+        return
+
+    copy = columnar_path(path, table_format)
+    try:
+        if table_format == 'parquet':
+            df.to_parquet(copy, index=index)
+        else:
+            # Feather only stores a default index.
+            (df.reset_index() if index else df.reset_index(drop=True)).to_feather(copy)
+    except (pyarrow.ArrowException, TypeError, ValueError) as error:
+        copy.unlink(missing_ok=True)
+        print('{} written as csv only: {}'.format(path.name, error))
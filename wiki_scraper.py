@@ -0,0 +1,243 @@
+import hashlib
+import pathlib
+import re
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+import lxml.html
+import requests
+from bs4 import BeautifulSoup
+from parallel import process_map
+
+
+class RateLimiter:
+    """
+    Class spacing out the requests sent to each host: at most 'rate' requests
+    per second per host, shared by all the threads of a fetcher.
+    """
+
+    def __init__(self, rate):
+        """
+        Class initialization with the maximum number of requests per second
+        and per host (None or 0 for no limit).
+        """
+
+        self.interval = 1 / rate if rate else 0
+        self.__lock = threading.Lock()
+        self.__next_time = {}
+
+    def wait(self, host):
+        """
+        Method to block until a new request can be sent to 'host'.
+        """
+
+        with self.__lock:
+            now = time.monotonic()
+            start = max(now, self.__next_time.get(host, now))
+            self.__next_time[host] = start + self.interval
+
+        time.sleep(max(0, start - now))
+
+
+class WikiFetcher:
+    """
+    Class fetching the html of wiki pages, given their link relative to
+    'base_url' (e.g. '/wiki/Splatoon_2'), with:
+      - an on-disk cache: one html file per link in 'cache_dir', so a rerun
+        only fetches the pages that are missing (failed pages are not cached)
+      - concurrent requests ('workers' threads) spaced out per host
+        ('rate' requests per second)
+      - retries with exponential backoff on connection errors, 429 and 5xx
+    'base_url' can point at a stand-in server, and 'fixture_dir' at a
+    directory of html files named like the cache files, which are then read
+    instead of any request.
+    """
+
+    def __init__(self, base_url='https://en.wikipedia.org', cache_dir='wiki_cache', workers=8,
+                 rate=5.0, retries=3, backoff=1.0, timeout=30, fixture_dir=None):
+        """
+        Class initialization with the fetching parameters.
+        """
+
+        self.base_url = base_url.rstrip('/')
+        self.cache_dir = pathlib.Path(cache_dir) if cache_dir is not None else None
+        self.fixture_dir = pathlib.Path(fixture_dir) if fixture_dir is not None else None
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self.__limiter = RateLimiter(rate)
+        self.__local = threading.local()
+
+        if self.cache_dir is not None and self.fixture_dir is None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def file_name(link):
+        """
+        Method to return the html file name of a link in the cache (and
+        fixture) directory.
+        """
+
+        name = urllib.parse.quote(link, safe='')
+        if len(name) > 200:
+            name = hashlib.sha1(link.encode('utf-8')).hexdigest()
+
+        return name + '.html'
+
+    def __session(self):
+        # requests sessions are not shared between threads
+        if not hasattr(self.__local, 'session'):
+            self.__local.session = requests.Session()
+        return self.__local.session
+
+    def __download(self, url):
+        host = urllib.parse.urlsplit(url).netloc
+
+        for attempt in range(self.retries + 1):
+            self.__limiter.wait(host)
+            try:
+                response = self.__session().get(url, timeout=self.timeout)
+            except requests.RequestException as error:
+                failure = error
+            else:
+                if response.status_code == 200:
+                    return response.text
+                if response.status_code != 429 and response.status_code < 500:
+                    print('{}: HTTP {}'.format(url, response.status_code))
+                    return None
+                failure = 'HTTP {}'.format(response.status_code)
+
+            if attempt < self.retries:
+                time.sleep(self.backoff * 2 ** attempt)
+
+        print('{}: failed after {} attempts ({})'.format(url, self.retries + 1, failure))
+        return None
+
+    def fetch(self, link):
+        """
+        Method to return the html of the page at 'link' from the fixtures,
+        the cache or the web (None if it could not be fetched).
+        """
+
+        file_name = self.file_name(link)
+
+        if self.fixture_dir is not None:
+            fixture = self.fixture_dir / file_name
+            return fixture.read_text(encoding='utf-8') if fixture.exists() else None
+
+        cached = self.cache_dir / file_name if self.cache_dir is not None else None
+        if cached is not None and cached.exists():
+            return cached.read_text(encoding='utf-8')
+
+        html = self.__download(self.base_url + link)
+
+        if html is not None and cached is not None:
+            # Write then rename, so an interrupted run never leaves a partial page
+            partial = cached.with_suffix('.part')
+            partial.write_text(html, encoding='utf-8')
+            partial.replace(cached)
+
+        return html
+
+    def fetch_all(self, links):
+        """
+        Method to fetch many pages concurrently. Returns their html in the
+        order of 'links' (None for the pages that could not be fetched).
+        """
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(self.fetch, links))
+
+
+# Sections kept from the game pages.
+PLOT_SECTIONS = "//h2[starts-with(string(.), 'Game') or starts-with(string(.), 'Plot')]"
+REFERENCES = re.compile(r'\[.*?\]+')
+
+
+def _soup_sections(html):
+    """
+    Function to extract the text of the 'Game...' and 'Plot...' sections of a
+    page with a full BeautifulSoup tree: each section title, then the
+    paragraphs following it up to the next title.
+    """
+
+    soup = BeautifulSoup(html, 'lxml')
+    text = ''
+
+    for section in soup.find_all('h2'):
+        if section.text.startswith('Game') or section.text.startswith('Plot'):
+            text += section.text + '\n\n'
+
+            for element in section.next_siblings:
+                if element.name and element.name.startswith('h'):
+                    break
+                elif element.name == 'p':
+                    text += element.text + '\n'
+
+    return text
+
+
+def _xpath_sections(html):
+    """
+    Function to extract the same text as '_soup_sections', selecting only
+    the section titles with an lxml XPath query and joining the pieces once.
+    """
+
+    parts = []
+
+    for section in lxml.html.fromstring(html).xpath(PLOT_SECTIONS):
+        parts.append(section.text_content() + '\n\n')
+
+        for element in section.itersiblings():
+            if not isinstance(element.tag, str):
+                # comments and processing instructions
+                continue
+            if element.tag.startswith('h'):
+                break
+            elif element.tag == 'p':
+                parts.append(element.text_content() + '\n')
+
+    return ''.join(parts)
+
+
+def clean_plot(text):
+    """
+    Function to clean the text of a plot: references ([1], [citation needed])
+    and line breaks removed, section titles dropped. Returns None for an
+    empty plot.
+    """
+
+    if not text:
+        return None
+
+    text = REFERENCES.sub('', text).replace('\n', ' ')
+
+    return text.replace('Gameplay ', '').replace('Game-play ', '').replace('Plot ', '')
+
+
+def extract_plot(html, parser='xpath'):
+    """
+    Function to extract the cleaned plot of a game page (None if the page is
+    missing or has no 'Game...'/'Plot...' section). 'parser' is 'xpath'
+    (lxml, only the wanted sections) or 'soup' (full BeautifulSoup tree).
+    """
+
+    if not html:
+        return None
+
+    return clean_plot(_xpath_sections(html) if parser == 'xpath' else _soup_sections(html))
+
+
+def extract_plots(pages, parser='xpath', processes=None, chunksize=16):
+    """
+    Function to extract the plots of many pages (html or None) in a pool of
+    'processes' processes, as parsing is CPU-bound (see
+    'parallel.process_map'). Returns the plots in the order of 'pages'.
+    """
+
+    pages = list(pages)
+
+    return process_map(extract_plot, pages, [parser] * len(pages), processes=processes, chunksize=chunksize)